@@ -0,0 +1,285 @@
+# Headless throughput benchmarks of the stages of building the database
+
+import sys
+sys.path.append('ingredient_parser/')
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import time
+from build_database import DatabaseBuilder
+from ingredient_parser import IngredientParser, warm_up
+from nutriscore import load_model, predict_nutriscore_batch
+from synthetic_corpus import SyntheticCorpus
+import recipe_parser
+
+
+STAGES = [
+    'startup',
+    'parse_html',
+    'ingredients_cold',
+    'ingredients_warm',
+    'nutriscore',
+    'build',
+]
+
+# Fraction of the baseline throughput a stage may lose before it is reported
+# as a regression
+THRESHOLD = 0.2
+
+
+def result(items, seconds):
+    return {
+        'items': items,
+        'seconds': seconds,
+        'per_second': items / seconds if seconds > 0 else float('inf'),
+    }
+
+
+def timed(function, items):
+    start = time.perf_counter()
+    function()
+    return result(items, time.perf_counter() - start)
+
+
+class CorpusRows:
+    '''The csv rows of n recipes of a corpus, generated as they are iterated.
+    seconds is the time spent generating them, which the stages leave out.
+    '''
+
+    def __init__(self, corpus, n):
+        self.corpus = corpus
+        self.n = n
+        self.seconds = 0
+
+    def __iter__(self):
+        for recipe_id in range(1, self.n + 1):
+            start = time.perf_counter()
+            row = self.corpus.csv_row(recipe_id)
+            self.seconds += time.perf_counter() - start
+            yield row
+
+
+def timed_rows(function, rows):
+    '''Like timed, for a function consuming the CorpusRows rows
+    '''
+    start = time.perf_counter()
+    function()
+    return result(rows.n, time.perf_counter() - start - rows.seconds)
+
+
+def bench_startup(args):
+    '''Processes per second that import the ingredient parser and create an
+    IngredientParser, before any parse loads the heavy libraries
+    '''
+    command = [sys.executable, '-c', 'import ingredient_parser; ingredient_parser.IngredientParser()']
+    return timed(lambda: subprocess.check_call(command, cwd='ingredient_parser'), 1)
+
+
+def bench_parse_html(corpus, args):
+    '''Pages parsed per second by parse_recipe, from html already in memory
+    '''
+    htmls = [(recipe_id, corpus.html(recipe_id)) for recipe_id in range(1, args.html_size + 1)]
+
+    def parse():
+        for recipe_id, html in htmls:
+            recipe_parser.parse_recipe(recipe_id, html, args.backend)
+    return timed(parse, len(htmls))
+
+
+def bench_ingredients(corpus, args):
+    '''Ingredient lines parsed per second by a new IngredientParser, then by
+    the same parser again with every line cached
+    '''
+    lines = corpus.ingredient_lines(args.size)
+    warm_up()
+    ingredient_parser = IngredientParser()
+    cold = timed(lambda: ingredient_parser.parse_many(lines), len(lines))
+    warm = timed(lambda: ingredient_parser.parse_many(lines), len(lines))
+    return cold, warm
+
+
+def bench_nutriscore(corpus, args):
+    '''Rows scored per second, in batches like DatabaseBuilder does
+    '''
+    model = load_model(args.model)
+    batch_size = DatabaseBuilder.RECIPES_PER_BATCH
+    rows = CorpusRows(corpus, args.size)
+
+    def predict():
+        recipes = (row[:len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP) - 1] for row in rows)
+        batch = list(itertools.islice(recipes, batch_size))
+        while batch:
+            predict_nutriscore_batch(model, batch)
+            batch = list(itertools.islice(recipes, batch_size))
+    return timed_rows(predict, rows)
+
+
+def bench_build(corpus, args):
+    '''Recipes built per second by DatabaseBuilder, from rows generated as
+    it reads them
+    '''
+    warm_up()
+    rows = CorpusRows(corpus, args.size)
+    with open(os.devnull, 'w') as f_output:
+        builder = DatabaseBuilder(None, f_output, args.model, workers=args.workers)
+        return timed_rows(lambda: builder.build_rows(rows, total=args.size), rows)
+
+
+def run(args):
+    corpus = SyntheticCorpus(args.seed)
+    results = dict()
+
+    for stage in STAGES:
+        if stage not in args.stages or stage in results:
+            continue
+        print('Running {}...'.format(stage), file=sys.stderr)
+        if stage == 'startup':
+            results[stage] = bench_startup(args)
+        elif stage == 'parse_html':
+            results[stage] = bench_parse_html(corpus, args)
+        elif stage in ['ingredients_cold', 'ingredients_warm']:
+            results['ingredients_cold'], results['ingredients_warm'] = bench_ingredients(corpus, args)
+        elif stage == 'nutriscore':
+            results[stage] = bench_nutriscore(corpus, args)
+        elif stage == 'build':
+            results[stage] = bench_build(corpus, args)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'size': args.size,
+            'html_size': args.html_size,
+            'seed': args.seed,
+            'backend': args.backend,
+            'workers': args.workers,
+        },
+        'results': {stage: results[stage] for stage in STAGES if stage in args.stages},
+    }
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Return, for each stage in both results and baseline, its throughput
+    relative to the baseline and whether it regressed by more than threshold.
+    """
+    comparison = dict()
+    for stage, current in results['results'].items():
+        if stage not in baseline['results']:
+            continue
+        ratio = current['per_second'] / baseline['results'][stage]['per_second']
+        comparison[stage] = {
+            'ratio': ratio,
+            'regression': ratio < 1 - threshold,
+        }
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Script that measures the throughput of each stage of building the database on a synthetic corpus')
+    parser.add_argument(
+        '-n',
+        '--size',
+        dest='size',
+        help='number of recipes and ingredient lines',
+        default=10000,
+        type=int,
+    )
+    parser.add_argument(
+        '--html-size',
+        dest='html_size',
+        help='number of pages parsed, which is much slower than the other stages',
+        default=1000,
+        type=int,
+    )
+    parser.add_argument(
+        '-s',
+        '--stages',
+        dest='stages',
+        help='stages to run',
+        nargs='+',
+        choices=STAGES,
+        default=STAGES,
+    )
+    parser.add_argument(
+        '--seed',
+        dest='seed',
+        help='seed of the synthetic corpus',
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        '-b',
+        '--backend',
+        dest='backend',
+        help='library used to extract recipes from the htmls',
+        choices=sorted(recipe_parser.BACKENDS),
+        default=recipe_parser.DEFAULT_BACKEND,
+        type=str,
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        help='number of worker processes of the build stage',
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        '-m',
+        '--model',
+        dest='model',
+        help='path to a nutriscore model, saved in the .npz format or pickled',
+        default='nutriscore.npz',
+        type=str
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        dest='output',
+        help='path to the json file the results are written to',
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        '--baseline',
+        dest='baseline',
+        help='path to the json results of a previous run to compare with',
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        '-t',
+        '--threshold',
+        dest='threshold',
+        help='fraction of the baseline throughput a stage may lose before failing',
+        default=THRESHOLD,
+        type=float,
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    comparison = dict()
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            comparison = compare(results, json.load(f), args.threshold)
+
+    for stage, stage_result in results['results'].items():
+        line = '{:<18} {:>12.1f}/s ({} in {:.2f}s)'.format(
+            stage, stage_result['per_second'], stage_result['items'], stage_result['seconds'])
+        if stage in comparison:
+            line += ' {:.2f}x baseline{}'.format(
+                comparison[stage]['ratio'], ' REGRESSION' if comparison[stage]['regression'] else '')
+        print(line)
+
+    if any(stage_comparison['regression'] for stage_comparison in comparison.values()):
+        sys.exit(1)
@@ -3,12 +3,29 @@
 import sys
 sys.path.append('ingredient_parser/')
 import os
-from load_ingredients import load_ingredients, INGREDIENTS_DIR
-from ingredient_parser import IngredientParser
+from load_ingredients import INGREDIENTS_DIR
+from ingredient_catalog import load_catalog
+from ingredient_parser import IngredientParser, warm_up
+from match_cache import MatchCache, MATCH_CACHE_PATH
+from stage_metrics import StageMetrics, clock
 import csv
 import argparse
-from nutriscore import load_model, predict_nutriscore
+from nutriscore import load_model, compute_input_batch, compute_input_matrix, predict_nutriscore_matrix
+from recipe_store import RecipeStore
+from recipe_schema import CSV_INDEX_TO_RELATIONSHIP, csv_values, features_matrix
+from recipe_ids import SeenIdSet, add_new, is_redirected
 import time
+import itertools
+import io
+import re
+import multiprocessing
+import json
+import cProfile
+import pstats
+from tqdm import tqdm
+from parallel import imap_ordered
+from rdf_writer import RdfWriter, ShardedFile
+from formatters import FORMATTERS, RdfFormatter
 
 
 class DatabaseBuilder:
@@ -21,78 +38,103 @@ class DatabaseBuilder:
         'coloring',
     ]
 
-    CSV_INDEX_TO_RELATIONSHIP = [
-        'id',
-        'url',
-        'title',
-        'img_url',
-        'servings',
-        'prep_time',
-        'rating',
-        'reviews',
-        'made_it_count',
-        'calories',
-        'total_fat',
-        'saturated_fat',
-        'cholesterol',
-        'sodium',
-        'potassium',
-        'total_carbohydrates',
-        'dietary_fiber',
-        'protein',
-        'sugars',
-        'vitamin_a',
-        'vitamin_c',
-        'calcium',
-        'iron',
-        'thiamin',
-        'niacin',
-        'vitamin_b6',
-        'magnesium',
-        'folate',
-        # Everything above this index is a <contains> relationship
-    ]
+    # Matches a raw ingredient containing any of INGREDIENTS_TO_IGNORE
+    IGNORED_INGREDIENTS = re.compile('|'.join(re.escape(ingredient) for ingredient in INGREDIENTS_TO_IGNORE))
+
+    # Kept for the callers of the builder, the schema is recipe_schema
+    CSV_INDEX_TO_RELATIONSHIP = CSV_INDEX_TO_RELATIONSHIP
 
     # parameters for beta distribution used for rating score
     ALPHA = 3
     BETA  = 2
 
-    def __init__(self, f_input, f_output, model):
+    # Number of recipes whose ingredients are parsed in one batch
+    RECIPES_PER_BATCH = 32
+
+    # Number of batches handed to each worker process ahead of time
+    BATCHES_PER_WORKER = 4
+
+    def __init__(self, f_input, f_output, model, recipes_per_batch=RECIPES_PER_BATCH,
+                 batch_size=IngredientParser.BATCH_SIZE, match_cache=None,
+                 cache_size=IngredientParser.CACHE_SIZE, workers=1, output_format='rdf', progress=False,
+                 seen=None, ingredient_catalog=None):
         self.f_input = f_input
         self.f_output = f_output
-
-        self.ingredients, self.alias_map = load_ingredients()
-        self.ingredient_parser = IngredientParser()
+        self.formatter = FORMATTERS[output_format]()
+        self.recipes_per_batch = recipes_per_batch
+        self.batch_size = batch_size
+        self.workers = workers
+        self.progress = progress
+        # Ids of the recipes already built, by this or previous builds
+        self.seen = seen if seen is not None else SeenIdSet()
+
+        # Loaded once and shared with the ingredient parser and the workers
+        self.ingredient_catalog = ingredient_catalog if ingredient_catalog is not None else load_catalog()
+
+        # Used to create the builders of the worker processes
+        self.options = dict(
+            model=model,
+            recipes_per_batch=recipes_per_batch,
+            batch_size=batch_size,
+            match_cache=match_cache,
+            cache_size=cache_size,
+            output_format=output_format,
+            ingredient_catalog=self.ingredient_catalog,
+        )
+
+        self.ingredients = self.ingredient_catalog.ingredients
+        self.alias_map = self.ingredient_catalog.alias_map
+        self.contains_nodes = DatabaseBuilder.ingredient_nodes(self.alias_map)
+
+        # Matches persisted by previous runs, looked up as they are needed
+        self.match_cache = None
+        if match_cache:
+            self.match_cache = MatchCache(match_cache).load()
+        # Timings of the stages of the builder and of its ingredient parser
+        self.metrics = StageMetrics()
+        self.ingredient_parser = IngredientParser(match_cache=self.match_cache, cache_size=cache_size,
+                                                  metrics=self.metrics, ingredient_catalog=self.ingredient_catalog)
         self.nutriscore_model = load_model(model)
 
         self.num_recipes_processed = 0
         self.num_recipes_failed = 0
+        self.num_recipes_skipped = 0
         self.duration = 0
 
+        # Latest cache statistics and metrics of each worker process, by pid
+        self.worker_cache_info = dict()
+        self.worker_metrics = dict()
+
     @staticmethod
-    def build_database_ingredients(f, ingredients, aliases):
+    def build_database_ingredients(f, ingredients, aliases, formatter=None, categories=None):
         """
         Given a File Object and a dictionary of ingredients (ingredient -> category),
         write ingredient nodes, category nodes, and the relationships between
-        ingredients and categories.
+        ingredients and categories. categories defaults to the files of the
+        ingredient folder.
         """
-        categories = os.listdir(INGREDIENTS_DIR)
+        if formatter is None:
+            formatter = RdfFormatter()
+        if categories is None:
+            categories = os.listdir(INGREDIENTS_DIR)
 
         # Write category nodes
-        for category in categories:
-            f.write('_:{} <dgraph.type> \"Category\" .\n'.format(category))
-            f.write('_:{} <cname> \"{}\" .\n'.format(
-                category, category.replace('_', ' ')))
+        lines = [formatter.categories(categories)]
 
         # Write ingredients nodes and the relationship between ingredient and category
+        nodes = DatabaseBuilder.ingredient_nodes(aliases)
         for ingredient in aliases.values():
-            category = ingredients[ingredient]
-            f.write('_:{} <iname> \"{}\" .\n'.format(
-                ingredient.replace(' ', '_'), ingredient))
-            f.write('_:{} <dgraph.type> \"Ingredient\" .\n'.format(
-                ingredient.replace(' ', '_')))
-            f.write('_:{} <categorized_as> _:{} .\n'.format(
-                ingredient.replace(' ', '_'), category))
+            lines.append(formatter.ingredient(nodes[ingredient], ingredient, ingredients[ingredient]))
+
+        f.write(''.join(lines))
+
+    @staticmethod
+    def ingredient_nodes(aliases):
+        """
+        Given a dictionary of aliases (alias -> ingredient), return a dictionary
+        from each alias to the blank node name of its ingredient.
+        """
+        return {alias: ingredient.replace(' ', '_') for alias, ingredient in aliases.items()}
 
     @staticmethod
     def get_rating_score(average_rating, num_ratings, alpha, beta):
@@ -104,77 +146,347 @@ class DatabaseBuilder:
         Given a row as a list and a File Object, dump the database for that row
         to the File Object.
         """
+        self.parse_csv_rows([row])
 
-        self.num_recipes_processed += 1
+    def parse_csv_rows(self, rows, features=None):
+        """
+        Given a list of rows, dump the database for those rows to the File
+        Object. The ingredients of all rows are parsed in a single batch.
+        features optionally gives the nutriscore features of the rows as a
+        float64 matrix, as RecipeStore.features returns them. Return the ids
+        of the recipes built, which are added to self.seen.
+        """
 
-        id = row[0]
-        url_id = row[1].split(r'/')[-3]
+        start = clock()
+        num_recipes_processed = self.num_recipes_processed
+        self.num_recipes_processed += len(rows)
 
         # if the id from the filename does not match the id of the url, redirection
         # has happened, and the row should be skipped to prevent duplicate entries.
-        if id != url_id:
-            return
-
-        try:
-            # Calculate nutrition score
-            recipe_data = row[:len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP) - 1]
-            nutrition_score = predict_nutriscore(self.nutriscore_model, recipe_data)
-            self.f_output.write('_:{} <nutrition_score> \"{:.2f}\" .\n'.format(id, nutrition_score))
-            # print(nutriscore)
-        except ZeroDivisionError:
-            print("recipe {} failed: division by zero".format(id))
-            return
-
-        for i in range(1, len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP) - 1):
-            self.f_output.write('_:{} <{}> \"{}\" .\n'.format(
-                id, DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP[i], row[i]))
-
-        raw_ingredients = row[len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP):]
-        parsed_ingredients = []
-
-        for raw_ingredient in raw_ingredients:
-            if any([ignored_ingredient in raw_ingredient for ignored_ingredient in DatabaseBuilder.INGREDIENTS_TO_IGNORE]):
+        kept = [i for i, row in enumerate(rows) if not is_redirected(row[0], row[1])]
+        rows = [rows[i] for i in kept]
+
+        # Calculate nutrition scores
+        nutriscore_start = clock()
+        if features is None:
+            recipe_input = compute_input_batch(
+                [row[:len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP) - 1] for row in rows])
+        else:
+            recipe_input = compute_input_matrix(features[kept])
+        nutrition_scores, zero_division = predict_nutriscore_matrix(self.nutriscore_model, recipe_input)
+        self.metrics.add('nutriscore', clock() - nutriscore_start, len(rows))
+
+        recipes = []
+        for row, nutrition_score, failed in zip(rows, nutrition_scores, zero_division):
+            id = row[0]
+
+            if failed:
+                print("recipe {} failed: division by zero".format(id))
                 continue
-            else:
-                parsed_ingredient = self.ingredient_parser.parse(raw_ingredient)
-                if parsed_ingredient is None:
-                    print('Failed parsing', raw_ingredient)
-                    self.num_recipes_failed += 1
-                    return
-                else:
-                    parsed_ingredient = self.alias_map[parsed_ingredient]
-                    parsed_ingredients.append(parsed_ingredient)
 
+            # The ingredients are parsed with their quotation marks escaped,
+            # as they were when every column was escaped before building, so
+            # they keep their matches and entries of the match cache
+            raw_ingredients = [
+                RdfFormatter.escape(raw_ingredient)
+                for raw_ingredient in row[len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP):]
+                if DatabaseBuilder.IGNORED_INGREDIENTS.search(raw_ingredient) is None
+            ]
+            recipes.append((row, nutrition_score, raw_ingredients))
+
+        ingredients_start = clock()
+        parsed_ingredients = self.ingredient_parser.parse_many(
+            [raw_ingredient for _, _, raw_ingredients in recipes for raw_ingredient in raw_ingredients],
+            batch_size=self.batch_size)
+        self.metrics.add('ingredients', clock() - ingredients_start, len(recipes))
+
+        built = []
+        first = 0
+        for row, nutrition_score, raw_ingredients in recipes:
+            last = first + len(raw_ingredients)
+            write_start = clock()
+            if self.write_recipe(row, nutrition_score, raw_ingredients, parsed_ingredients[first:last]):
+                built.append(row[0])
+            self.metrics.add('write', clock() - write_start)
+            first = last
+
+        # Only the recipes built are seen, so the failed ones are built again
+        # by the next build, e.g. once the catalog has their ingredients
+        for id in built:
+            add_new(self.seen, id)
+
+        self.metrics.add('recipe', clock() - start, self.num_recipes_processed - num_recipes_processed)
+        return built
+
+    def write_recipe(self, row, nutrition_score, raw_ingredients, parsed_ingredients):
+        """
+        Given a row, its nutrition score and its parsed ingredients, dump the
+        database for that row to the File Object. Return whether every
+        ingredient of the row was matched.
+        """
+
+        id = row[0]
+        fields = [
+            (DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP[i], row[i])
+            for i in range(1, len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP) - 1)
+        ]
+
+        for raw_ingredient, parsed_ingredient in zip(raw_ingredients, parsed_ingredients):
+            if parsed_ingredient is None:
+                print('Failed parsing', raw_ingredient)
+                self.num_recipes_failed += 1
+                self.f_output.write(self.formatter.recipe(id, nutrition_score, fields, None, None))
+                return False
 
-        # REQ 1-1: Recipe ontology contains relationships.
-        for parsed_ingredient in parsed_ingredients:
-            self.f_output.write('_:{} <contains> _:{} .\n'.format(
-                id, parsed_ingredient.replace(' ', '_')))
+        contains = [self.contains_nodes[parsed_ingredient] for parsed_ingredient in parsed_ingredients]
 
         # Calculate rating score
         average_rating = float(row[6])
         num_ratings = float(row[7])
         rating_score = DatabaseBuilder.get_rating_score(average_rating, num_ratings, DatabaseBuilder.ALPHA, DatabaseBuilder.BETA)
-        self.f_output.write('_:{} <rating_score> \"{:.2f}\" .\n'.format(id, rating_score))
+
+        # The nodes of the recipe are written at once
+        self.f_output.write(self.formatter.recipe(id, nutrition_score, fields, contains, rating_score))
+        return True
 
     # REQ 1-2: Store ontology in queryable format.
-    def build(self, build_ingredients=True):
-        start_time = time.time()
+    def build(self, build_ingredients=True, total=None):
+        """
+        Build the database of the csv file. total is the number of recipes
+        shown by the progress bar, if known.
+        """
         reader = csv.reader(self.f_input,  delimiter=',', quoting=csv.QUOTE_ALL)
+        self.build_rows(reader, build_ingredients, total)
+
+    def build_rows(self, rows, build_ingredients=True, total=None):
+        """
+        Like build, but for an iterable of rows, given as lists of strings,
+        instead of the csv file.
+        """
+        self._build(((batch, None) for batch in self._read_batches(rows)), build_ingredients, total)
+
+    def build_recipes(self, recipes, build_ingredients=True, total=None):
+        """
+        Like build, but for an iterable of the Recipe records of parser.py.
+        The nutriscore features are read from the records instead of being
+        converted back from strings, but the triples are still written from
+        the csv_values of each record.
+        """
+        batches = (
+            ([csv_values(recipe.to_row()) for recipe in batch], features_matrix(batch))
+            for batch in self._read_batches(recipes)
+        )
+        self._build(batches, build_ingredients, total)
+
+    def build_store(self, store, build_ingredients=True):
+        """
+        Like build, but for a RecipeStore instead of the csv file. The
+        nutriscore features are read from its columns.
+        """
+        batches = (
+            ([store.row(i) for i in range(start, min(start + self.recipes_per_batch, len(store)))],
+             store.features(start, start + self.recipes_per_batch))
+            for start in range(0, len(store), self.recipes_per_batch)
+        )
+        self._build(batches, build_ingredients, len(store))
+
+    def _build(self, batches, build_ingredients, total):
+        start_time = time.time()
 
         if build_ingredients:
-            self.build_database_ingredients(self.f_output, self.ingredients, self.alias_map)
+            self.build_database_ingredients(self.f_output, self.ingredients, self.alias_map, self.formatter,
+                                            self.ingredient_catalog.categories)
 
-        for row in reader:
-            row = [col.replace(r'"', r'\"') for col in row]
-            self.parse_csv_row(row)
+        with tqdm(total=total, unit='recipes', disable=not self.progress) as progress:
+            batches = self._unseen_batches(batches, progress)
+            if self.workers > 1:
+                self._build_parallel(batches, progress)
+            else:
+                for rows, features in batches:
+                    self.parse_csv_rows(rows, features)
+                    progress.update(len(rows))
+                    self._flush_matches(MatchCache.FLUSH_SIZE)
+
+        self._flush_matches()
 
         self.duration = time.time() - start_time
 
+    def _flush_matches(self, min_size=0):
+        """
+        Write the new matches to the match cache once there are min_size of
+        them. Only the parent process writes the cache: the workers send their
+        new matches with the output of their batches.
+        """
+        if self.match_cache is not None and len(self.match_cache.new_matches) >= min_size:
+            self.match_cache.flush()
+
+    def _read_batches(self, rows):
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, self.recipes_per_batch))
+            if not batch:
+                break
+            yield batch
+
+    def _unseen_batches(self, batches, progress):
+        """
+        Drop the rows of redirected recipes, of recipes already in self.seen
+        and of recipes already queued by this build from the batches, before
+        their ingredients are parsed. The ids are added to self.seen once the
+        recipes are built.
+        """
+        queued = SeenIdSet()
+        for rows, features in batches:
+            # Redirected ids are not queued, so the recipe of their own page
+            # is still built if it is downloaded later
+            kept = [
+                i for i, row in enumerate(rows)
+                if not is_redirected(row[0], row[1]) and row[0] not in self.seen and add_new(queued, row[0])
+            ]
+            skipped = len(rows) - len(kept)
+            if skipped:
+                self.num_recipes_skipped += skipped
+                progress.update(skipped)
+                rows = [rows[i] for i in kept]
+                if features is not None:
+                    features = features[kept]
+            if rows:
+                yield rows, features
+
+    def _build_parallel(self, batches, progress):
+        """
+        Parse the batches of rows in a pool of worker processes and write their
+        output in the original order, so it is identical to a serial build.
+        """
+        window = self.workers * DatabaseBuilder.BATCHES_PER_WORKER
+
+        # Forked workers share the resources loaded by the parent
+        warm_up()
+        with multiprocessing.Pool(self.workers, _init_worker, (self.options,)) as pool:
+            for result in imap_ordered(pool, _build_batch, batches, window):
+                output, built, num_recipes_processed, num_recipes_failed, pid, cache_info, metrics, new_matches = result
+                self.f_output.write(output)
+                for id in built:
+                    add_new(self.seen, id)
+                self.num_recipes_processed += num_recipes_processed
+                self.num_recipes_failed += num_recipes_failed
+                self.worker_cache_info[pid] = cache_info
+                self.worker_metrics[pid] = metrics
+                progress.update(num_recipes_processed)
+                if self.match_cache is not None:
+                    for expression, ingredient in new_matches.items():
+                        self.match_cache[expression] = ingredient
+                    self._flush_matches(MatchCache.FLUSH_SIZE)
+
+    def cache_info(self):
+        """
+        Return the cache statistics of the ingredient parser of this builder
+        merged with those of its worker processes.
+        """
+        merged = self.ingredient_parser.cache_info()
+        for cache_info in self.worker_cache_info.values():
+            for stage, info in cache_info.items():
+                total = merged[stage]
+                merged[stage] = total._replace(
+                    hits=total.hits + info.hits,
+                    misses=total.misses + info.misses,
+                    evictions=total.evictions + info.evictions,
+                    currsize=total.currsize + info.currsize,
+                )
+        return merged
+
+    def stage_metrics(self):
+        """
+        Return the stage metrics of this builder merged with those of its
+        worker processes.
+        """
+        merged = StageMetrics()
+        merged.merge(self.metrics)
+        for metrics in self.worker_metrics.values():
+            merged.merge(metrics)
+        return merged
+
+    def report(self):
+        """
+        Return the statistics of the last build as a dictionary.
+        """
+        return {
+            'recipes': self.num_recipes_processed,
+            'failed': self.num_recipes_failed,
+            'skipped': self.num_recipes_skipped,
+            'seconds': self.duration,
+            'recipes_per_second': self.num_recipes_processed / self.duration if self.duration else 0.0,
+            'workers': self.workers,
+            'stages': self.stage_metrics().report(),
+            'caches': {stage: dict(info._asdict()) for stage, info in self.cache_info().items()},
+        }
+
+    def write_metrics(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
     def statistics(self):
-        print('Took {}s per recipe on average'.format(self.duration / self.num_recipes_processed))
+        # e.g. every recipe was skipped as already built
+        if self.num_recipes_processed:
+            print('Took {}s per recipe on average'.format(self.duration / self.num_recipes_processed))
         print('Failed {}/{} recipes'.format(self.num_recipes_failed, self.num_recipes_processed))
-        print(self.ingredient_parser.find_closest_match.cache_info())
+        print('Skipped {} duplicate or redirected recipes'.format(self.num_recipes_skipped))
+        for stage, info in self.cache_info().items():
+            print('{} cache: {} hits, {} misses, {} evictions, {}/{} entries'.format(
+                stage, info.hits, info.misses, info.evictions, info.currsize, info.maxsize))
+        if self.match_cache is not None:
+            print('{} matches in {}'.format(len(self.match_cache), self.match_cache.path))
+        for stage, report in self.stage_metrics().report().items():
+            print('{} stage: {} items in {:.2f}s, p50 {:.2e}s, p95 {:.2e}s, p99 {:.2e}s'.format(
+                stage, report['count'], report['seconds'], report['p50'], report['p95'], report['p99']))
+
+
+def count_lines(path):
+    """
+    Return the number of lines of a file, which is the number of rows of a csv
+    file unless some of its values contain line breaks.
+    """
+    count = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            count += chunk.count(b'\n')
+    return count
+
+
+# Builder of a worker process of DatabaseBuilder._build_parallel
+_worker_builder = None
+
+
+def _init_worker(options):
+    global _worker_builder
+    _worker_builder = DatabaseBuilder(None, None, **options)
+
+
+def _build_batch(batch):
+    rows, features = batch
+    builder = _worker_builder
+    builder.f_output = io.StringIO()
+    num_recipes_processed = builder.num_recipes_processed
+    num_recipes_failed = builder.num_recipes_failed
+
+    built = builder.parse_csv_rows(rows, features)
+
+    # The parent process persists the new matches
+    new_matches = dict()
+    if builder.match_cache is not None:
+        new_matches = dict(builder.match_cache.new_matches)
+        builder.match_cache.new_matches.clear()
+
+    return (
+        builder.f_output.getvalue(),
+        built,
+        builder.num_recipes_processed - num_recipes_processed,
+        builder.num_recipes_failed - num_recipes_failed,
+        os.getpid(),
+        builder.ingredient_parser.cache_info(),
+        builder.metrics,
+        new_matches,
+    )
 
 
 if __name__ == '__main__':
@@ -184,7 +496,7 @@ if __name__ == '__main__':
         '-i',
         '--input',
         dest='input',
-        help='path to the input csv file',
+        help='path to the input csv file, or .npz recipe store',
         default='htmls.csv',
         type=str,
     )
@@ -192,21 +504,111 @@ if __name__ == '__main__':
         '-o',
         '--output',
         dest='output',
-        help='path to the output file',
-        default='recipedia.rdf',
+        help='path to the output file, gzip compressed if it ends with .gz, recipedia.rdf or recipedia.json by default',
+        default=None,
         type=str,
     )
+    parser.add_argument(
+        '-f',
+        '--format',
+        dest='format',
+        help='format of the output',
+        choices=sorted(FORMATTERS),
+        default='rdf',
+        type=str,
+    )
+    parser.add_argument(
+        '--shard-size',
+        dest='shard_size',
+        help='split the output into files of about this many MB, e.g. recipedia-0000.rdf',
+        default=None,
+        type=int,
+    )
     parser.add_argument(
         '-m',
         '--model',
         dest='model',
-        help='path to a serialized nutriscore model',
-        default='nutriscore.model',
+        help='path to a nutriscore model, saved in the .npz format or pickled',
+        default='nutriscore.npz',
+        type=str
+    )
+    parser.add_argument(
+        '-c',
+        '--match-cache',
+        dest='match_cache',
+        help='path to the persistent ingredient match cache, empty to disable it',
+        default=MATCH_CACHE_PATH,
+        type=str
+    )
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        help='maximum number of entries of each ingredient parsing cache',
+        default=IngredientParser.CACHE_SIZE,
+        type=int
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        help='number of worker processes parsing recipes',
+        default=1,
+        type=int
+    )
+    parser.add_argument(
+        '--metrics',
+        dest='metrics',
+        help='path to the json file the timings of each stage are written to (default: OUTPUT.metrics.json)',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--profile',
+        dest='profile',
+        help='profile the build with cProfile and dump the statistics to this file, '
+             'which only covers the main process when there are workers',
+        default=None,
+        type=str
+    )
+    parser.add_argument(
+        '--no-progress',
+        dest='progress',
+        help='do not show the progress bar',
+        action='store_false',
+    )
+    parser.add_argument(
+        '--seen',
+        dest='seen',
+        help='path to the set of the ids of the recipes built, which are skipped and to which the new ones are added',
+        default=None,
         type=str
     )
     args = parser.parse_args()
 
-    with open(args.input, 'r') as f_input, open(args.output, 'w') as f_output:
-            builder = DatabaseBuilder(f_input, f_output, args.model)
-            builder.build()
+    if args.output is None:
+        args.output = 'recipedia' + FORMATTERS[args.format].extension
+    shard_size = args.shard_size * 2 ** 20 if args.shard_size else None
+    profiler = cProfile.Profile() if args.profile else None
+    seen = SeenIdSet.load(args.seen) if args.seen else None
+    with RdfWriter(ShardedFile(args.output, shard_size)) as f_output:
+            builder = DatabaseBuilder(None, f_output, args.model, match_cache=args.match_cache,
+                                      cache_size=args.cache_size, workers=args.workers,
+                                      output_format=args.format, progress=args.progress, seen=seen)
+            if profiler is not None:
+                profiler.enable()
+            if args.input.endswith('.npz'):
+                builder.build_store(RecipeStore.load(args.input))
+            else:
+                with open(args.input, 'r') as f_input:
+                    builder.f_input = f_input
+                    builder.build(total=count_lines(args.input) if args.progress else None)
+            if profiler is not None:
+                profiler.disable()
             builder.statistics()
+
+    if args.seen:
+        builder.seen.save(args.seen)
+    builder.write_metrics(args.metrics or args.output + '.metrics.json')
+    if profiler is not None:
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
@@ -0,0 +1,443 @@
+# Downloads the recipe htmls with concurrent requests, as an alternative to
+# scraper.js
+
+import argparse
+import asyncio
+import bisect
+import concurrent.futures
+import csv
+import datetime
+import html
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+
+RECIPE_BASE_URL = 'https://www.allrecipes.com/recipe/'
+DOWNLOAD_BASE_PATH = './download'
+
+# Same defaults as scraper.js
+START_ID = 6663
+END_ID = 269344
+MAX_RETRY = 3
+MAX_CONSECUTIVE_FAILURES = 3
+
+CONCURRENCY = 8
+# Requests per second
+RATE = 4.0
+# Seconds waited before the first retry of a recipe, doubled for each retry
+BACKOFF = 1.0
+TIMEOUT = 30
+
+# Number of recipes done between two saves of the progress
+SAVE_INTERVAL = 100
+
+# Outcomes of fetching a recipe
+FETCHED = 'fetched'
+MISSING = 'missing'
+NO_NUTRITION = 'no nutrition'
+FAILED = 'failed'
+
+# Link of a recipe page to its full nutrition facts, which scraper.js clicks
+# before saving the page, and the class of the values it then waits for
+NUTRITION_BUTTON = re.compile(rb'<a\s[^>]*class="see-full-nutrition"[^>]*>')
+NUTRITION_HREF = re.compile(rb'\shref="([^"]*)"')
+NUTRIENT_VALUE = b'nutrient-value'
+BODY = re.compile(rb'<body[^>]*>(.*)</body>', re.DOTALL | re.IGNORECASE)
+
+
+class NutritionNotLoaded(Exception):
+    pass
+
+
+def with_nutrition(page, nutrition):
+    '''Return a recipe page with the body of its full nutrition page appended
+    to its body, where clicking the nutrition button shows it
+    '''
+    body = BODY.search(nutrition)
+    if body is not None:
+        nutrition = body.group(1)
+    end = page.lower().rfind(b'</body>')
+    if end == -1:
+        return page + nutrition
+    return page[:end] + nutrition + page[end:]
+
+
+class TokenBucket:
+    '''Lets acquire return rate times per second on average, and up to
+    capacity times at once after being idle
+    '''
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class IdRanges:
+    '''Set of recipe ids stored as sorted, disjoint inclusive ranges, which
+    records the recipes done by previous runs of the fetcher
+    '''
+
+    def __init__(self, ranges=()):
+        self.starts = []
+        self.ends = []
+        for start, end in ranges:
+            self.add_range(start, end)
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path):
+            return IdRanges()
+        with open(path, 'r') as f:
+            return IdRanges(json.load(f))
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.ranges(), f)
+        os.replace(tmp_path, path)
+
+    def ranges(self):
+        return [[start, end] for start, end in zip(self.starts, self.ends)]
+
+    def __contains__(self, recipe_id):
+        i = bisect.bisect_right(self.starts, recipe_id) - 1
+        return i >= 0 and recipe_id <= self.ends[i]
+
+    def add(self, recipe_id):
+        self.add_range(recipe_id, recipe_id)
+
+    def add_range(self, start, end):
+        # Ranges overlapping or adjacent to [start, end] are merged into it
+        i = bisect.bisect_left(self.ends, start - 1)
+        j = bisect.bisect_right(self.starts, end + 1)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+
+
+class RecipeFetcher:
+    '''Fetches recipe pages with up to concurrency requests at once over
+    kept-alive connections, rate limited by a token bucket.
+
+    Like scraper.js, a recipe is tried at most max_retry times, waiting
+    between 1 and 2 times backoff seconds before the first retry and twice as
+    long before each next one, and the fetcher stops
+    once max_consecutive_failures recipes failed in a row. A recipe the
+    server does not have, or whose page has no nutrition button, is skipped
+    without retrying. The full nutrition facts the button links to are
+    fetched and added to the page, as scraper.js saves it after clicking it.
+    '''
+
+    def __init__(self, base_url=RECIPE_BASE_URL, concurrency=CONCURRENCY, rate=RATE, max_retry=MAX_RETRY,
+                 max_consecutive_failures=MAX_CONSECUTIVE_FAILURES, backoff=BACKOFF, timeout=TIMEOUT):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.max_retry = max_retry
+        self.max_consecutive_failures = max_consecutive_failures
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, capacity=concurrency)
+
+        # requests is blocking, so its calls run in threads. A Session is not
+        # thread-safe, so each thread has its own, keeping one connection alive
+        self.executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+        self.local = threading.local()
+        self.sessions = []
+        self.sessions_lock = threading.Lock()
+
+        # Pages are handled one at a time in their own thread, so handlers
+        # need no locking and do not block the requests
+        self.handler_executor = concurrent.futures.ThreadPoolExecutor(1)
+
+        self.counts = {FETCHED: 0, MISSING: 0, NO_NUTRITION: 0, FAILED: 0}
+        self.consecutive_failures = 0
+        self.aborted = False
+
+    def close(self):
+        self.executor.shutdown()
+        self.handler_executor.shutdown()
+        for session in self.sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _session(self):
+        '''Return the Session of the calling thread
+        '''
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.local.session = session
+            with self.sessions_lock:
+                self.sessions.append(session)
+        return session
+
+    def _get(self, url):
+        response = self._session().get(url, timeout=self.timeout)
+        return response.status_code, response.content
+
+    def _get_recipe(self, recipe_id):
+        '''Return the HTTP status of a recipe and its page with the full
+        nutrition facts, or None if the page has no nutrition button
+        '''
+        url = self.base_url + str(recipe_id)
+        status, page = self._get(url)
+        if status != 200:
+            return status, None
+        button = NUTRITION_BUTTON.search(page)
+        href = NUTRITION_HREF.search(button.group(0)) if button is not None else None
+        if href is None:
+            return status, None
+        if NUTRIENT_VALUE in page:
+            return status, page
+
+        nutrition_url = urllib.parse.urljoin(url, html.unescape(href.group(1).decode('utf-8')))
+        status, nutrition = self._get(nutrition_url)
+        if status != 200:
+            return status, None
+        if NUTRIENT_VALUE not in nutrition:
+            raise NutritionNotLoaded('no nutrient values in {}'.format(nutrition_url))
+        return status, with_nutrition(page, nutrition)
+
+    async def fetch(self, recipe_id):
+        '''Return the outcome of fetching a recipe and its html as bytes
+        '''
+        loop = asyncio.get_event_loop()
+        for attempt in range(self.max_retry):
+            await self.bucket.acquire()
+            try:
+                status, content = await loop.run_in_executor(self.executor, self._get_recipe, recipe_id)
+            except (requests.RequestException, NutritionNotLoaded) as e:
+                print('Failed for recipeId={} for attempt={}: {}'.format(recipe_id, attempt, e))
+                status = None
+            else:
+                if status == 200:
+                    return (FETCHED, content) if content is not None else (NO_NUTRITION, None)
+                # Server errors and rate limiting are retried, the other
+                # errors mean the recipe does not exist
+                if status < 500 and status != 429:
+                    return MISSING, None
+                print('Failed for recipeId={} for attempt={}: HTTP {}'.format(recipe_id, attempt, status))
+
+            if attempt < self.max_retry - 1:
+                await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+        return FAILED, None
+
+    async def run(self, recipe_ids, handle, done=None, save=None):
+        '''Fetch the recipes of recipe_ids and call handle(recipe_id, html)
+        with each page fetched. The recipes fetched or missing are added to
+        the IdRanges done, and save is called every SAVE_INTERVAL of them.
+        '''
+        loop = asyncio.get_event_loop()
+        recipe_ids = iter(recipe_ids)
+
+        async def fetch_next():
+            # recipe_ids is shared by the coroutines, each taking the next id
+            for recipe_id in recipe_ids:
+                if self.aborted:
+                    return
+                outcome, content = await self.fetch(recipe_id)
+                self.counts[outcome] += 1
+
+                if outcome == FAILED:
+                    self.consecutive_failures += 1
+                    if self.consecutive_failures >= self.max_consecutive_failures:
+                        print('Failed {} recipes consecutively. Abort.'.format(self.consecutive_failures))
+                        self.aborted = True
+                    continue
+
+                self.consecutive_failures = 0
+                if outcome == FETCHED:
+                    await loop.run_in_executor(self.handler_executor, handle, recipe_id, content)
+                elif outcome == NO_NUTRITION:
+                    print('skip: recipe {} does not have a nutrition button'.format(recipe_id))
+                else:
+                    print('skip: recipe {} does not exist'.format(recipe_id))
+                if done is not None:
+                    done.add(recipe_id)
+                    if save is not None and (sum(self.counts.values()) - self.counts[FAILED]) % SAVE_INTERVAL == 0:
+                        save()
+
+        await asyncio.gather(*[fetch_next() for _ in range(self.concurrency)])
+        return not self.aborted
+
+
+def fetch_recipes(fetcher, start_id, end_id, handle, progress=None):
+    '''Fetch the recipes start_id to end_id, inclusive, that are not recorded
+    in the progress file, and record the recipes done in it. Return whether
+    the fetcher finished without aborting.
+    '''
+    done = IdRanges.load(progress) if progress else IdRanges()
+    recipe_ids = (recipe_id for recipe_id in range(start_id, end_id + 1) if recipe_id not in done)
+    save = (lambda: done.save(progress)) if progress else None
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(fetcher.run(recipe_ids, handle, done, save))
+    finally:
+        loop.close()
+        if progress:
+            done.save(progress)
+
+
+class HtmlWriter:
+    '''Writes each page to <recipe id>.html under a folder, like scraper.js
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def __call__(self, recipe_id, html):
+        with open(os.path.join(self.path, '{}.html'.format(recipe_id)), 'wb') as f:
+            f.write(html)
+        print('{} saved!'.format(recipe_id))
+
+
+class RowWriter:
+    '''Parses each page with parser.py and appends its row to a csv file, in
+    the order the pages are fetched
+    '''
+
+    def __init__(self, f_csv, backend):
+        # Imported here so fetching htmls does not load the parsing libraries
+        import recipe_parser
+        self.recipe_parser = recipe_parser
+
+        self.writer = csv.writer(f_csv, delimiter=',', quoting=csv.QUOTE_ALL)
+        self.backend = backend
+
+    def __call__(self, recipe_id, html):
+        try:
+            recipe = self.recipe_parser.parse_recipe(recipe_id, str(html, 'utf-8'), self.backend)
+        except self.recipe_parser.NoNutritionFactsException:
+            print('No nutrition facts for {}'.format(recipe_id))
+            return
+        except self.recipe_parser.RedirectedRecipeException:
+            print('Redirected {}'.format(recipe_id))
+            return
+        except Exception:
+            print('Failed', recipe_id)
+            return
+        self.writer.writerow(self.recipe_parser.recipe_to_row(recipe))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Script to download raw recipe htmls from allrecipes.com with concurrent requests')
+    parser.add_argument(
+        '-s',
+        '--startId',
+        dest='start_id',
+        help='the ID of the first recipe to download',
+        default=START_ID,
+        type=int,
+    )
+    parser.add_argument(
+        '-e',
+        '--endId',
+        dest='end_id',
+        help='the ID of the last recipe to download',
+        default=END_ID,
+        type=int,
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        dest='output',
+        help='path to the folder the htmls are written to (default: ./download/<timestamp>)',
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        '--csv',
+        dest='csv',
+        help='parse the pages and append their rows to this csv file instead of writing the htmls',
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        '-b',
+        '--backend',
+        dest='backend',
+        help='library used to extract recipes from the htmls with --csv',
+        choices=['html5lib', 'lxml'],
+        default='lxml',
+        type=str,
+    )
+    parser.add_argument(
+        '-p',
+        '--progress',
+        dest='progress',
+        help='path to the file recording the recipes done, which are skipped by the next run (default: ./download/progress.json)',
+        default=os.path.join(DOWNLOAD_BASE_PATH, 'progress.json'),
+        type=str,
+    )
+    parser.add_argument(
+        '-c',
+        '--concurrency',
+        dest='concurrency',
+        help='maximum number of concurrent requests',
+        default=CONCURRENCY,
+        type=int,
+    )
+    parser.add_argument(
+        '-r',
+        '--rate',
+        dest='rate',
+        help='maximum number of requests per second, 0 for no limit',
+        default=RATE,
+        type=float,
+    )
+    parser.add_argument(
+        '--base-url',
+        dest='base_url',
+        help='url the recipe ids are appended to',
+        default=RECIPE_BASE_URL,
+        type=str,
+    )
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.progress) or '.', exist_ok=True)
+    with RecipeFetcher(args.base_url, args.concurrency, args.rate) as fetcher:
+        if args.csv:
+            with open(args.csv, 'a') as f_csv:
+                finished = fetch_recipes(fetcher, args.start_id, args.end_id, RowWriter(f_csv, args.backend), args.progress)
+        else:
+            output = args.output or os.path.join(DOWNLOAD_BASE_PATH, datetime.datetime.now().isoformat())
+            finished = fetch_recipes(fetcher, args.start_id, args.end_id, HtmlWriter(output), args.progress)
+        print('Fetched {}, missing {}, without nutrition button {}, failed {}'.format(
+            fetcher.counts[FETCHED], fetcher.counts[MISSING], fetcher.counts[NO_NUTRITION], fetcher.counts[FAILED]))
+
+    if not finished:
+        sys.exit(1)
@@ -0,0 +1,148 @@
+import json
+
+
+class RdfFormatter:
+    '''Formats the nodes built by DatabaseBuilder as N-Quad RDF triples
+    '''
+
+    extension = '.rdf'
+
+    @staticmethod
+    def escape(value):
+        return value.replace(r'"', r'\"')
+
+    def categories(self, categories):
+        lines = []
+        for category in categories:
+            lines.append('_:{} <dgraph.type> \"Category\" .\n'.format(category))
+            lines.append('_:{} <cname> \"{}\" .\n'.format(
+                category, category.replace('_', ' ')))
+        return ''.join(lines)
+
+    def ingredient(self, node, ingredient, category):
+        return (
+            '_:{} <iname> \"{}\" .\n'.format(node, ingredient) +
+            '_:{} <dgraph.type> \"Ingredient\" .\n'.format(node) +
+            '_:{} <categorized_as> _:{} .\n'.format(node, category)
+        )
+
+    def recipe(self, id, nutrition_score, fields, contains, rating_score):
+        '''Format a recipe given its fields as (relationship, value) pairs.
+        contains and rating_score are None if its ingredients failed parsing.
+        '''
+        lines = ['_:{} <nutrition_score> \"{:.2f}\" .\n'.format(id, nutrition_score)]
+
+        for relationship, value in fields:
+            lines.append('_:{} <{}> \"{}\" .\n'.format(id, relationship, self.escape(value)))
+
+        if contains is None:
+            return ''.join(lines)
+
+        # REQ 1-1: Recipe ontology contains relationships.
+        for node in contains:
+            lines.append('_:{} <contains> _:{} .\n'.format(id, node))
+
+        lines.append('_:{} <rating_score> \"{:.2f}\" .\n'.format(id, rating_score))
+        return ''.join(lines)
+
+
+class JsonFormatter:
+    '''Formats the nodes built by DatabaseBuilder as newline delimited JSON
+    objects, which the Dgraph bulk and live loaders read as a stream. The
+    same predicates as RdfFormatter are set, with numbers for the numeric
+    ones.
+    '''
+
+    extension = '.json'
+
+    INTEGER_RELATIONSHIPS = {
+        'servings',
+        'prep_time',
+        'reviews',
+        'made_it_count',
+    }
+
+    FLOAT_RELATIONSHIPS = {
+        'nutrition_score',
+        'rating',
+        'calories',
+        'total_fat',
+        'saturated_fat',
+        'cholesterol',
+        'sodium',
+        'potassium',
+        'total_carbohydrates',
+        'dietary_fiber',
+        'protein',
+        'sugars',
+        'vitamin_a',
+        'vitamin_c',
+        'calcium',
+        'iron',
+        'thiamin',
+        'niacin',
+        'vitamin_b6',
+        'magnesium',
+        'folate',
+        'rating_score',
+    }
+
+    @staticmethod
+    def dump(node):
+        return json.dumps(node, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    @staticmethod
+    def typed(relationship, value):
+        '''Return the value of relationship as a number if it is numeric and
+        as the original string if it cannot be converted
+        '''
+        try:
+            if relationship in JsonFormatter.INTEGER_RELATIONSHIPS:
+                return int(value)
+            if relationship in JsonFormatter.FLOAT_RELATIONSHIPS:
+                return float(value)
+        except ValueError:
+            pass
+        return value
+
+    def categories(self, categories):
+        return ''.join([
+            self.dump({
+                'uid': '_:{}'.format(category),
+                'dgraph.type': 'Category',
+                'cname': category.replace('_', ' '),
+            })
+            for category in categories
+        ])
+
+    def ingredient(self, node, ingredient, category):
+        return self.dump({
+            'uid': '_:{}'.format(node),
+            'iname': ingredient,
+            'dgraph.type': 'Ingredient',
+            'categorized_as': {'uid': '_:{}'.format(category)},
+        })
+
+    def recipe(self, id, nutrition_score, fields, contains, rating_score):
+        '''Format a recipe given its fields as (relationship, value) pairs.
+        contains and rating_score are None if its ingredients failed parsing.
+        '''
+        recipe = {
+            'uid': '_:{}'.format(id),
+            'nutrition_score': round(float(nutrition_score), 2),
+        }
+
+        for relationship, value in fields:
+            recipe[relationship] = self.typed(relationship, value)
+
+        if contains is not None:
+            recipe['contains'] = [{'uid': '_:{}'.format(node)} for node in contains]
+            recipe['rating_score'] = round(rating_score, 2)
+
+        return self.dump(recipe)
+
+
+FORMATTERS = {
+    'rdf': RdfFormatter,
+    'json': JsonFormatter,
+}
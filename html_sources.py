@@ -0,0 +1,291 @@
+# Reads the downloaded recipe htmls from a folder, a tar or zip archive or a
+# bundle packed by this script
+
+import argparse
+import calendar
+import codecs
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tarfile
+import tempfile
+import zipfile
+
+# A bundle starts with BUNDLE_MAGIC and the offset of its index, followed by
+# the htmls back to back and the index: the json list of the name, offset,
+# size and modification time in nanoseconds of each html
+BUNDLE_MAGIC = b'HTMLBDL1'
+BUNDLE_HEADER = struct.Struct('<8sQ')
+
+# First bytes of the gzip, bzip2 and xz files tarfile decompresses, which can
+# only be read sequentially
+COMPRESSED_MAGICS = [b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00']
+
+
+class HtmlSource:
+    '''The html files of a folder or archive, by name. read_bytes and stat
+    are implemented by each kind of source.
+    '''
+
+    def names(self):
+        '''Return the names of the html files
+        '''
+        raise NotImplementedError
+
+    def read_bytes(self, name):
+        raise NotImplementedError
+
+    def stat(self, name):
+        '''Return the size and modification time in nanoseconds of a html
+        '''
+        raise NotImplementedError
+
+    def read(self, name):
+        return str(self.read_bytes(name), 'utf-8')
+
+    def read_many(self, names):
+        '''Yield the name and content of each html of names, or None if it
+        cannot be read
+        '''
+        for name in names:
+            try:
+                yield name, self.read(name)
+            except Exception:
+                yield name, None
+
+    def digest(self, name):
+        return hashlib.sha1(self.read_bytes(name)).hexdigest()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HtmlDirectory(HtmlSource):
+    '''The html files under a folder, as scraper.js downloads them. Their
+    names are their paths.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def names(self):
+        names = []
+        for (root, dirs, files) in os.walk(self.path, topdown=True):
+            for file in files:
+                if file.endswith('.html'):
+                    names.append(os.path.join(root, file))
+        return names
+
+    def read_bytes(self, name):
+        with open(name, 'rb') as f:
+            return f.read()
+
+    def read(self, name):
+        with codecs.open(name, 'r', 'utf-8') as f:
+            return f.read()
+
+    def stat(self, name):
+        stat = os.stat(name)
+        return stat.st_size, stat.st_mtime_ns
+
+
+class HtmlBundle(HtmlSource):
+    '''A bundle of htmls, memory-mapped so a html is decoded straight from
+    the page cache
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+
+        magic, index_offset = BUNDLE_HEADER.unpack_from(self.mmap)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError('{} is not a bundle of htmls'.format(path))
+        self.index = {
+            name: (offset, size, mtime)
+            for name, offset, size, mtime in json.loads(str(self.view[index_offset:], 'utf-8'))
+        }
+
+    @staticmethod
+    def pack(path, output):
+        '''Pack the html files under the folder path into the bundle output,
+        keeping their sizes and modification times so a parse manifest stays
+        current. Return the number of htmls packed.
+        '''
+        directory = HtmlDirectory(path)
+        names = sorted(directory.names())
+        index = []
+
+        tmp_output = output + '.tmp'
+        with open(tmp_output, 'wb') as f:
+            f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, 0))
+            for name in names:
+                _, mtime = directory.stat(name)
+                data = directory.read_bytes(name)
+                index.append([os.path.relpath(name, path), f.tell(), len(data), mtime])
+                f.write(data)
+
+            index_offset = f.tell()
+            f.write(json.dumps(index).encode('utf-8'))
+            f.seek(0)
+            f.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, index_offset))
+        os.replace(tmp_output, output)
+
+        return len(names)
+
+    def names(self):
+        return list(self.index)
+
+    def read_bytes(self, name):
+        '''Return a html as a memoryview of the bundle, without copying it
+        '''
+        offset, size, _ = self.index[name]
+        return self.view[offset:offset + size]
+
+    def stat(self, name):
+        _, size, mtime = self.index[name]
+        return size, mtime
+
+    def close(self):
+        self.view.release()
+        self.mmap.close()
+
+
+class TarHtmls(HtmlSource):
+    '''The html files of an uncompressed tar archive, memory-mapped like a
+    bundle
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with tarfile.open(path, 'r:') as tar:
+            self.members = {
+                member.name: member
+                for member in tar.getmembers()
+                if member.isfile() and member.name.endswith('.html')
+            }
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+
+    def names(self):
+        return list(self.members)
+
+    def read_bytes(self, name):
+        member = self.members[name]
+        return self.view[member.offset_data:member.offset_data + member.size]
+
+    def stat(self, name):
+        member = self.members[name]
+        return member.size, int(member.mtime * 10 ** 9)
+
+    def close(self):
+        self.view.release()
+        self.mmap.close()
+
+
+class CompressedTarHtmls(HtmlBundle):
+    '''The html files of a compressed tar archive, which can only be read
+    sequentially. They are decompressed in a single pass into a temporary
+    file holding them back to back, memory-mapped like a bundle.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.index = dict()
+        self.spool = tempfile.TemporaryFile()
+        with tarfile.open(path, 'r|*') as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith('.html'):
+                    with tar.extractfile(member) as f:
+                        data = f.read()
+                    self.index[member.name] = (self.spool.tell(), len(data), int(member.mtime * 10 ** 9))
+                    self.spool.write(data)
+        self.spool.flush()
+        # An empty file cannot be memory-mapped
+        self.mmap = mmap.mmap(self.spool.fileno(), 0, access=mmap.ACCESS_READ) if self.spool.tell() else b''
+        self.view = memoryview(self.mmap)
+
+    def close(self):
+        self.view.release()
+        if self.mmap:
+            self.mmap.close()
+        self.spool.close()
+
+
+class ZipHtmls(HtmlSource):
+    '''The html files of a zip archive, each compressed separately
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.zip = zipfile.ZipFile(path, 'r')
+        self.members = {
+            info.filename: info
+            for info in self.zip.infolist()
+            if not info.is_dir() and info.filename.endswith('.html')
+        }
+
+    def names(self):
+        return list(self.members)
+
+    def read_bytes(self, name):
+        return self.zip.read(self.members[name])
+
+    def stat(self, name):
+        info = self.members[name]
+        return info.file_size, calendar.timegm(info.date_time) * 10 ** 9
+
+    def close(self):
+        self.zip.close()
+
+
+def open_htmls(path):
+    '''Return the HtmlSource of a folder, a tar or zip archive, optionally
+    compressed, or a bundle of htmls
+    '''
+    if os.path.isdir(path):
+        return HtmlDirectory(path)
+
+    with open(path, 'rb') as f:
+        magic = f.read(len(BUNDLE_MAGIC))
+    if magic == BUNDLE_MAGIC:
+        return HtmlBundle(path)
+    if zipfile.is_zipfile(path):
+        return ZipHtmls(path)
+    if any(magic.startswith(compressed_magic) for compressed_magic in COMPRESSED_MAGICS):
+        return CompressedTarHtmls(path)
+    if tarfile.is_tarfile(path):
+        return TarHtmls(path)
+    raise ValueError('{} is not a folder, archive or bundle of htmls'.format(path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Script that packs a folder of downloaded recipe htmls into a bundle')
+    parser.add_argument(
+        'path',
+        help='path to the folder of the htmls',
+        type=str,
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        dest='output',
+        help='path to the bundle',
+        default='htmls.bundle',
+        type=str,
+    )
+    args = parser.parse_args()
+
+    print('Packed {} htmls'.format(HtmlBundle.pack(args.path, args.output)))
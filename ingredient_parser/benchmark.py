@@ -50,17 +50,26 @@ if __name__ == '__main__':
 
         ingredient_parser = IngredientParser(benchmark=True)
         reader = csv.reader(f_input,  delimiter=',',quoting=csv.QUOTE_ALL)
+        raw_ingredients = []
         for row in reader:
             if line_number in test_lines:
-                raw_ingredients = row[len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP):]
-                total_ingredients += len(raw_ingredients)
-                for raw_ingredient in raw_ingredients:
-                    try:
-                        ingredient_parser.parse(raw_ingredient)
-                    except ValueError as e:
-                        # silent for now
-                        pass
+                raw_ingredients += row[len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP):]
             line_number += 1
+        total_ingredients = len(raw_ingredients)
+
+        # Parse the ingredients of all sampled recipes in one batch, and one
+        # at a time if an ingredient of the batch fails
+        try:
+            ingredient_parser.parse_many(raw_ingredients)
+        except ValueError as e:
+            # The failed batch was already counted
+            ingredient_parser.num_ingredients_parsed -= len(raw_ingredients)
+            for raw_ingredient in raw_ingredients:
+                try:
+                    ingredient_parser.parse(raw_ingredient)
+                except ValueError as e:
+                    # silent for now
+                    pass
 
     print()
     print('Average number of ingredients per recipe: {}'.format(total_ingredients / args.number))
@@ -0,0 +1,99 @@
+import argparse
+import string
+import time
+from scipy.special import softmax
+from ingredient_parser import IngredientParser, THRESHOLD, split, threshold_ratio, tokenize
+
+
+def legacy_get_score(expression, fixed_ingredient):
+    '''get_score as it was before the catalog was compiled, kept as the
+    baseline of this benchmark
+    '''
+
+    score = 0
+
+    expression = split(expression, string.punctuation + r'\s')
+    expression.reverse()
+
+    fixed_ingredient = split(fixed_ingredient, string.punctuation + r'\s')
+    fixed_ingredient.reverse()
+    fixed_ingredient_len = len(fixed_ingredient)
+
+    matched = 0
+
+    expression_copy = list(expression)
+
+    weight = list(range(fixed_ingredient_len))
+    weight.reverse()
+    weight = softmax(weight)
+
+    for i in range(0, len(fixed_ingredient)):
+        local_highest_score = float('-inf')
+        local_highest_idx = 0
+        if len(expression_copy) > 0:
+            for j in range(0, len(expression_copy)):
+                ratio = threshold_ratio(
+                    fixed_ingredient[i], expression_copy[j], THRESHOLD)
+                if ratio > local_highest_score:
+                    local_highest_score = ratio
+                    local_highest_idx = j
+            score += weight[i] * local_highest_score
+            if local_highest_score > 0:
+                matched += 1
+            expression_copy.pop(local_highest_idx)
+
+    matching_modifier = float(matched) / float(fixed_ingredient_len)
+    return score * matching_modifier
+
+
+def run(name, score, pairs):
+    start_time = time.time()
+    for expression, fixed_ingredient in pairs:
+        score(expression, fixed_ingredient)
+    duration = time.time() - start_time
+    print('{:<24} {:>10.0f} calls/s'.format(name, len(pairs) / duration))
+    return duration
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Script that measures the throughput of IngredientParser.get_score')
+    parser.add_argument(
+        '-n',
+        '--number',
+        dest='number',
+        help='number of expressions scored against the whole catalog',
+        default=20,
+        type=int,
+    )
+    args = parser.parse_args()
+
+    expressions = [
+        r"1 1/4 cup all-purpose flour",
+        r"2 egg",
+        r"1/2 tablespoon butter, melted",
+        r"1/2 cup frozen blueberry, thawed",
+        r"1/2 package linguine pasta",
+        r"2 tablespoon chopped fresh parsley, or",
+        r"1 pound large shrimp, peeled and deveined",
+        r"2 pound skinless, boneless chicken breast halve",
+    ]
+    expressions = [expressions[i % len(expressions)] for i in range(args.number)]
+
+    ingredient_parser = IngredientParser()
+    pairs = [(e, f) for e in expressions for f in ingredient_parser.ingredients]
+
+    for expression, fixed_ingredient in pairs[:1000]:
+        assert legacy_get_score(expression, fixed_ingredient) == ingredient_parser.get_score(expression, fixed_ingredient)
+
+    compiled_pairs = []
+    for expression, fixed_ingredient in pairs:
+        expression_tokens = tokenize(expression)
+        expression_tokens.reverse()
+        compiled_pairs.append((expression_tokens, ingredient_parser.catalog[fixed_ingredient]))
+
+    before = run('legacy get_score', legacy_get_score, pairs)
+    run('get_score', ingredient_parser.get_score, pairs)
+    after = run('score_tokens', IngredientParser.score_tokens, compiled_pairs)
+    print('Speedup: {:.2f}x'.format(before / after))
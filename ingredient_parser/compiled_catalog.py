@@ -0,0 +1,51 @@
+import functools
+import numpy as np
+from ingredient_index import tokenize
+
+
+@functools.lru_cache(maxsize=None)
+def position_weights(n):
+    '''Return the weights of the n tokens of a reversed catalog ingredient.
+
+    Using softmax so the weights add up to 1. Reversed so it is more heavily
+    weighted towards the end of the string
+    '''
+    weight = np.arange(n - 1, -1, -1, dtype=np.float64)
+
+    # Computed like scipy.special.softmax, which is slow to import
+    weight = np.exp(weight - weight.max(initial=0))
+    return tuple(float(w) for w in weight / weight.sum())
+
+
+class CompiledIngredient:
+    '''A catalog ingredient tokenized the way get_score compares it
+    '''
+
+    __slots__ = ('name', 'tokens', 'length', 'weights')
+
+    def __init__(self, name):
+        tokens = tokenize(name)
+        tokens.reverse()
+
+        self.name = name
+        self.tokens = tuple(tokens)
+        self.length = len(tokens)
+        self.weights = position_weights(self.length)
+
+
+class CompiledCatalog:
+    '''Pre-tokenized ingredients of the catalog, so scoring an expression
+    against an ingredient does no tokenizing or weight computation
+    '''
+
+    def __init__(self, ingredients):
+        self.entries = {name: CompiledIngredient(name) for name in ingredients}
+
+    def __getitem__(self, name):
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = CompiledIngredient(name)
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
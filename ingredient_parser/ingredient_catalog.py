@@ -0,0 +1,122 @@
+import hashlib
+import os
+import pickle
+import sys
+from load_ingredients import load_ingredients, INGREDIENTS_DIR
+from ingredient_index import IngredientIndex, THRESHOLD
+from compiled_catalog import CompiledCatalog
+from token_trie import TokenTrie
+from match_cache import catalog_hash
+
+# Name of the snapshot file written next to the ingredient folder
+CATALOG_SNAPSHOT = 'catalog.pickle'
+
+# Version of the snapshot file, to increase when a change the key of the
+# snapshot cannot see, e.g. of pickle or numpy, makes older snapshots invalid
+SNAPSHOT_VERSION = 2
+
+# Source files of the catalog and the classes it holds, part of the key of the
+# snapshot so older snapshots are compiled again when the code changes
+CATALOG_SOURCES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), file)
+    for file in ['load_ingredients.py', 'compiled_catalog.py', 'ingredient_index.py', 'token_trie.py',
+                 'ingredient_catalog.py']
+]
+
+# Catalogs loaded by this process, by ingredient folder and threshold, which
+# forked worker processes inherit
+_catalogs = dict()
+
+
+def snapshot_key(ing_dir=INGREDIENTS_DIR, threshold=THRESHOLD):
+    """
+    Return the key of the catalog compiled from ing_dir with threshold: the
+    hash of the ingredient files and of CATALOG_SOURCES, the threshold, the
+    version of Python and SNAPSHOT_VERSION, which changes whenever any of
+    them does.
+    """
+    h = hashlib.sha1()
+    for source in CATALOG_SOURCES:
+        with open(source, 'rb') as f:
+            h.update(f.read() + b'\0')
+    python = '{}.{}'.format(*sys.version_info[:2])
+    return '{} {} {} {} {}'.format(catalog_hash(ing_dir), h.hexdigest(), threshold, python, SNAPSHOT_VERSION)
+
+
+class IngredientCatalog:
+    """
+    The ingredients of the catalog, their aliases and categories, and the
+    structures compiled from them to match expressions.
+    """
+
+    def __init__(self, ingredients, alias_map, categories, threshold=THRESHOLD):
+        self.ingredients = ingredients
+        self.alias_map = alias_map
+        self.categories = categories
+        self.compiled = CompiledCatalog(ingredients)
+        self.index = IngredientIndex(ingredients, threshold)
+        self.trie = TokenTrie(ingredients)
+
+    @staticmethod
+    def compile(ing_dir=INGREDIENTS_DIR, threshold=THRESHOLD):
+        ingredients, alias_map = load_ingredients(ing_dir)
+        categories = [file for file in os.listdir(ing_dir) if file not in ['.pytest_cache']]
+        return IngredientCatalog(ingredients, alias_map, categories, threshold)
+
+
+def _read_snapshot(path, key):
+    """
+    Return the catalog of the snapshot at path, or None if it is missing,
+    unreadable or was written for another key.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) == key:
+                return pickle.load(f)
+    except Exception:
+        # Unpickling a snapshot of another version of Python or of the code
+        # can raise almost anything, e.g. ValueError for an unsupported
+        # protocol or ImportError for a renamed module
+        pass
+    return None
+
+
+def _write_snapshot(path, catalog, key):
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(key, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(catalog, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        # The snapshot only saves time, e.g. on a read-only checkout
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_catalog(ing_dir=INGREDIENTS_DIR, threshold=THRESHOLD, snapshot=None):
+    """
+    Return the IngredientCatalog of ing_dir, read from the snapshot file while
+    its key is unchanged, and compiled and written to the snapshot otherwise.
+    The snapshot is CATALOG_SNAPSHOT next to ing_dir by default, and an empty
+    path disables it.
+    """
+    if snapshot is None:
+        snapshot = os.path.join(os.path.dirname(os.path.abspath(ing_dir)), CATALOG_SNAPSHOT)
+    key = snapshot_key(ing_dir, threshold) if snapshot else None
+    catalog = _read_snapshot(snapshot, key) if snapshot else None
+    if catalog is None:
+        catalog = IngredientCatalog.compile(ing_dir, threshold)
+        if snapshot:
+            _write_snapshot(snapshot, catalog, key)
+    return catalog
+
+
+def load_catalog(ing_dir=INGREDIENTS_DIR, threshold=THRESHOLD):
+    """
+    Like read_catalog, but only reads the catalog once per process.
+    """
+    key = (os.path.abspath(ing_dir), threshold)
+    if key not in _catalogs:
+        _catalogs[key] = read_catalog(ing_dir, threshold)
+    return _catalogs[key]
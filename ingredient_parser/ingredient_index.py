@@ -0,0 +1,136 @@
+import collections
+import re
+import string
+from fuzzywuzzy import fuzz
+
+TOKEN_SEPARATORS = re.compile(r'[{}]'.format(string.punctuation + r'\s'))
+
+# fuzz.ratio below which two tokens score 0 against each other
+THRESHOLD = 80
+
+# Score below which an expression matches no ingredient
+MATCHING_THRESHOLD = 20
+
+
+def tokenize(s):
+    '''Split s into the same tokens IngredientParser.get_score compares
+    '''
+    return TOKEN_SEPARATORS.split(s)
+
+
+def ngrams(token, n):
+    '''Return a Counter of the character n-grams of token
+    '''
+    return collections.Counter(token[i:i + n] for i in range(len(token) - n + 1))
+
+
+class IngredientIndex:
+    '''Inverted index from catalog tokens and their character n-grams to the
+    ingredients that contain them.
+
+    An ingredient can only get a non-zero score from get_score if at least one
+    of its tokens reaches the fuzzy matching threshold against a token of the
+    expression, so only those ingredients need to be scored. Tokens that cannot
+    reach the threshold are ruled out with a length filter and the q-gram count
+    filter before fuzz.ratio is called at all.
+    '''
+
+    NGRAM_SIZE = 2
+
+    def __init__(self, ingredients, threshold):
+        self.threshold = threshold
+
+        # Ingredients in catalog order, so candidates are scored in the same
+        # order as an exhaustive scan and ties are broken the same way
+        self.ingredients = list(ingredients)
+
+        self.token_to_ingredients = collections.defaultdict(list)
+        self.tokens_by_length = collections.defaultdict(list)
+        self.ngram_to_tokens = collections.defaultdict(list)
+
+        for i, ingredient in enumerate(self.ingredients):
+            for token in set(tokenize(ingredient)):
+                if token:
+                    self.token_to_ingredients[token].append(i)
+
+        for token in self.token_to_ingredients:
+            self.tokens_by_length[len(token)].append(token)
+            for gram, count in ngrams(token, IngredientIndex.NGRAM_SIZE).items():
+                self.ngram_to_tokens[gram].append((token, count))
+
+        # When nothing scores above 0, the exhaustive scan settles on the
+        # first of the longest ingredients
+        self.longest_ingredient = None
+        for ingredient in self.ingredients:
+            if self.longest_ingredient is None or len(ingredient) > len(self.longest_ingredient):
+                self.longest_ingredient = ingredient
+
+    def _min_common_length(self, n, m):
+        '''Smallest longest-common-subsequence two tokens of length n and m need
+        for fuzz.ratio to round up to the threshold
+        '''
+        # 100 * 2 * lcs / (n + m) >= threshold - 0.5
+        return -(-(2 * self.threshold - 1) * (n + m) // 400)
+
+    def similar_tokens(self, token):
+        '''Return the catalog tokens whose fuzz.ratio with token reaches the
+        threshold
+        '''
+        return [t for t in self.similarities(token) if t in self.token_to_ingredients]
+
+    def similarities(self, token):
+        '''Return a dictionary from the catalog tokens whose fuzz.ratio with
+        token reaches the threshold to that ratio. Every other token scores 0
+        against token in get_score.
+        '''
+        n = len(token)
+        if n == 0:
+            # fuzz.ratio scores two empty strings 100, and 0 otherwise
+            return {'': 100}
+
+        q = IngredientIndex.NGRAM_SIZE
+        shared = collections.Counter()
+        for gram, count in ngrams(token, q).items():
+            for candidate, candidate_count in self.ngram_to_tokens.get(gram, ()):
+                shared[candidate] += min(count, candidate_count)
+
+        candidates = []
+        required_ngrams = {}
+        for m in self.tokens_by_length:
+            min_lcs = self._min_common_length(n, m)
+            if min(n, m) < min_lcs:
+                continue
+
+            # Two strings within edit distance k share at least
+            # max(n, m) - q + 1 - k * q q-grams, and k <= n + m - 2 * lcs
+            required = max(n, m) - q + 1 - q * (n + m - 2 * min_lcs)
+            if required <= 0:
+                candidates.extend(self.tokens_by_length[m])
+            else:
+                required_ngrams[m] = required
+
+        for candidate, count in shared.items():
+            required = required_ngrams.get(len(candidate))
+            if required is not None and count >= required:
+                candidates.append(candidate)
+
+        similarities = dict()
+        for candidate in candidates:
+            ratio = fuzz.ratio(candidate, token)
+            if ratio >= self.threshold:
+                similarities[candidate] = ratio
+        return similarities
+
+    def candidates(self, expression, similarities=None):
+        '''Return the ingredients that can score above 0 against expression,
+        in catalog order. similarities maps the tokens of expression to their
+        similarities, if they are already computed.
+        '''
+        if similarities is None:
+            similarities = {token: self.similarities(token) for token in set(tokenize(expression))}
+
+        indices = set()
+        for token_similarities in similarities.values():
+            for similar_token in token_similarities:
+                indices.update(self.token_to_ingredients.get(similar_token, ()))
+        return [self.ingredients[i] for i in sorted(indices)]
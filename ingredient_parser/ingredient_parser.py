@@ -1,6 +1,5 @@
 # REQ 9-3: Ingredient parser
 
-import inflect
 import ply.lex as lex
 import ply.yacc as yacc
 from ply.lex import TOKEN
@@ -8,23 +7,63 @@ import re
 import os
 from fuzzywuzzy import fuzz
 import string
-from scipy.special import softmax
-import spacy
 import collections
-import functools
-from load_ingredients import load_ingredients
-
-nlp = spacy.load("en_core_web_sm")
-THRESHOLD = 80
+from ingredient_index import tokenize, THRESHOLD, MATCHING_THRESHOLD
+from ingredient_catalog import load_catalog
+from stage_cache import LRUCache, MISSING
+from stage_metrics import StageMetrics, clock
+
+# The adposition removal only needs the tagger, the dependency parser and,
+# with spacy 3, the attribute ruler mapping the tags to parts of speech. The
+# other pipes are disabled, the ones a model does not have being ignored
+DISABLED_PIPES = ['ner', 'lemmatizer', 'textcat']
 separators = r'[{}]'.format(string.punctuation + r'\s')
 
 
+# spacy and inflect take seconds to import, so they are only loaded by the
+# first parse. Call warm_up before forking workers to share them.
+_nlp = None
+_engine = None
+
+
+def get_nlp():
+    '''Return the spacy nlp engine, loading it on first use
+    '''
+    global _nlp
+    if _nlp is None:
+        import spacy
+        _nlp = spacy.load("en_core_web_sm", disable=DISABLED_PIPES)
+    return _nlp
+
+
+def get_engine():
+    '''Return the inflect engine used to convert between single and plural
+    forms, creating it on first use
+    '''
+    global _engine
+    if _engine is None:
+        import inflect
+        _engine = inflect.engine()
+    return _engine
+
+
+def warm_up():
+    '''Load the resources parse uses lazily
+    '''
+    get_nlp()
+    get_engine()
+
+
 def _remove_parenthesis(s):
     return re.sub(r" ?\([^)]+\)", "", s)
 
 
+def _strip_parenthesis(s):
+    return _remove_parenthesis(s).strip()
+
+
 def _get_singular(s):
-    singular = IngredientParser.engine.singular_noun(s)
+    singular = get_engine().singular_noun(s)
     if (singular):
         return singular
     else:
@@ -53,7 +92,10 @@ def remove_adopositions(s, nlp):
     '''Given a string s and the spacy nlp engine, return a string without adpositions.
     For example, "shrimp in shell" -> "shrimp".
     '''
-    doc = nlp(s)
+    return _remove_adpositions_from_doc(nlp(s))
+
+
+def _remove_adpositions_from_doc(doc):
     indices_to_remove = []
     for token in doc:
         if token.pos_ == 'ADP':
@@ -64,13 +106,46 @@ def remove_adopositions(s, nlp):
 
 class IngredientParser:
 
-    MATCHING_THRESHOLD = 20
-
-    # Used to convert between single and plural forms
-    engine = inflect.engine()
-
-    def __init__(self, benchmark=False):
-        self.ingredients, self.alias_map = load_ingredients()
+    MATCHING_THRESHOLD = MATCHING_THRESHOLD
+
+    # Number of strings spacy processes at once in parse_many
+    BATCH_SIZE = 256
+
+    # Stages of parse whose results are cached, in the order they run. The
+    # 'parse' stage maps a raw string to its final result, and the
+    # 'similarity' stage a token to its similarities to the catalog tokens
+    CACHE_STAGES = ['parse', 'parenthesis', 'adpositions', 'singular', 'match', 'similarity']
+
+    # Maximum number of entries kept by each stage cache
+    CACHE_SIZE = 2 ** 16
+
+    def __init__(self, benchmark=False, match_cache=None, cache_size=CACHE_SIZE, metrics=None,
+                 ingredient_catalog=None):
+        # The IngredientCatalog is shared with the DatabaseBuilder using this
+        # parser and, by default, with every parser of the process
+        if ingredient_catalog is None:
+            ingredient_catalog = load_catalog()
+        self.ingredients = ingredient_catalog.ingredients
+        self.alias_map = ingredient_catalog.alias_map
+        self.catalog = ingredient_catalog.compiled
+        self.index = ingredient_catalog.index
+        self.trie = ingredient_catalog.trie
+
+        # Time spent computing each stage on a cache miss, possibly shared
+        # with the DatabaseBuilder using this parser
+        self.metrics = metrics if metrics is not None else StageMetrics()
+
+        # Optional MatchCache shared across runs
+        self.match_cache = match_cache
+
+        # cache_size is either the size of every stage cache or a dictionary
+        # from stage to size
+        if not isinstance(cache_size, dict):
+            cache_size = {stage: cache_size for stage in IngredientParser.CACHE_STAGES}
+        self.caches = {
+            stage: LRUCache(cache_size.get(stage, IngredientParser.CACHE_SIZE))
+            for stage in IngredientParser.CACHE_STAGES
+        }
 
         self.benchmark = False
 
@@ -84,56 +159,118 @@ class IngredientParser:
         '''Get a score between expression and fixed_ingredient by comparing how
         similar they are.
         '''
+        expression = tokenize(expression)
+        expression.reverse()
+        return self.score_tokens(expression, self.catalog[fixed_ingredient])
 
-        score = 0
+    @staticmethod
+    def score_tokens(expression, fixed_ingredient, similarities=None):
+        '''Get the score of get_score from the reversed tokens of the
+        expression and a CompiledIngredient.
 
-        expression = split(expression, string.punctuation + r'\s')
-        expression.reverse()
-        expression_len = len(expression)
+        similarities gives, for each token of the expression, a dictionary from
+        the catalog tokens to their threshold_ratio with it, missing tokens
+        scoring 0. Computing it once per expression saves scoring the same
+        token pairs for every ingredient.
+        '''
 
-        fixed_ingredient = split(fixed_ingredient, string.punctuation + r'\s')
-        fixed_ingredient.reverse()
-        fixed_ingredient_len = len(fixed_ingredient)
+        tokens = fixed_ingredient.tokens
+        weight = fixed_ingredient.weights
 
-        matched = 0
+        if similarities is None:
+            similarities = [
+                {token: threshold_ratio(token, expression_token, THRESHOLD) for token in tokens}
+                for expression_token in expression
+            ]
 
-        expression_copy = list(expression)
+        score = 0
+        matched = 0
 
-        # Using softmax so the weights add up to 1
-        # Reversed so it is more heavily weighted towards the end of the string
-        weight = list(range(fixed_ingredient_len))
-        weight.reverse()
-        weight = softmax(weight)
+        # Bit j is set once expression[j] has been matched to a fixed token
+        used = 0
+        remaining = len(expression)
 
-        for i in range(0, len(fixed_ingredient)):
+        for i in range(0, fixed_ingredient.length):
+            if remaining == 0:
+                break
             local_highest_score = float('-inf')
             local_highest_idx = 0
-            if len(expression_copy) > 0:
-                for j in range(0, len(expression_copy)):
-                    ratio = threshold_ratio(
-                        fixed_ingredient[i], expression_copy[j], THRESHOLD)
-                    if ratio > local_highest_score:
-                        local_highest_score = ratio
-                        local_highest_idx = j
-                score += weight[i] * local_highest_score
-                if local_highest_score > 0:
-                    matched += 1
-                expression_copy.pop(local_highest_idx)
-
-        matching_modifier = float(matched) / float(fixed_ingredient_len)
+            for j in range(0, len(expression)):
+                if used >> j & 1:
+                    continue
+                ratio = similarities[j].get(tokens[i], 0)
+                if ratio > local_highest_score:
+                    local_highest_score = ratio
+                    local_highest_idx = j
+            score += weight[i] * local_highest_score
+            if local_highest_score > 0:
+                matched += 1
+            used |= 1 << local_highest_idx
+            remaining -= 1
+
+        matching_modifier = float(matched) / float(fixed_ingredient.length)
         return score * matching_modifier
 
-    @functools.lru_cache(maxsize=None)
+    def _cached(self, stage, key, compute):
+        '''Return compute(key) through the cache of stage, recording the time
+        of the lookup in the metrics of stage whether it hits or misses
+        '''
+        start = clock()
+        cache = self.caches[stage]
+        value = cache.get(key)
+        if value is MISSING:
+            value = compute(key)
+            cache[key] = value
+        self.metrics.add(stage, clock() - start)
+        return value
+
+    def cache_info(self):
+        '''Return a dictionary from stage to the CacheInfo of its cache
+        '''
+        return {stage: self.caches[stage].info() for stage in IngredientParser.CACHE_STAGES}
+
     def find_closest_match(self, expression):
         '''Find the closest ingredient in the dictionary of ingredients
         that matches the given expression
         '''
+        return self._cached('match', expression, self._find_persisted_match)
+
+    def _find_persisted_match(self, expression):
+        if self.match_cache is None:
+            return self._find_closest_match(expression)
+
+        match = self.match_cache.get(expression, MISSING)
+        if match is MISSING:
+            match = self._find_closest_match(expression)
+            self.match_cache[expression] = match
+        return match
+
+    def _find_closest_match(self, expression):
         highest_score = float('-inf')
         closest_match = None
 
-        for fixed_ingredient in self.ingredients.keys():
+        expression_tokens = tokenize(expression)
+        expression_tokens.reverse()
 
-            score = self.get_score(expression, fixed_ingredient)
+        # The ingredients whose tokens all occur in the expression outscore
+        # the rest of the catalog, and are few enough to score directly
+        candidates = self.trie.matches(expression_tokens) if self.trie is not None else None
+        similarities = None
+
+        if not candidates:
+            # Similarities of each distinct token of the expression to the
+            # catalog tokens, shared by the scores of all the candidates. Only
+            # ingredients sharing a similar token can score above 0
+            token_similarities = {
+                token: self._cached('similarity', token, self.index.similarities)
+                for token in set(expression_tokens)
+            }
+            similarities = [token_similarities[token] for token in expression_tokens]
+            candidates = self.index.candidates(expression, token_similarities)
+
+        for fixed_ingredient in candidates:
+
+            score = self.score_tokens(expression_tokens, self.catalog[fixed_ingredient], similarities)
 
             if score > highest_score:
                 highest_score = score
@@ -143,6 +280,12 @@ class IngredientParser:
                 if len(fixed_ingredient) > len(closest_match):
                     closest_match = fixed_ingredient
 
+        if highest_score <= 0:
+            # Every ingredient scored 0, which an exhaustive scan resolves to
+            # the longest ingredient in the catalog
+            highest_score = 0
+            closest_match = self.index.longest_ingredient
+
         if self.benchmark:
             self.scores.append(highest_score)
 
@@ -165,11 +308,61 @@ class IngredientParser:
         if self.benchmark:
             self.num_ingredients_parsed += 1
 
-        s = _remove_parenthesis(s).strip()
-        s = remove_adopositions(s, nlp)
-        s = _get_singular(s)
+        return self._cached('parse', s, self._parse)
+
+    def _parse(self, s):
+        s = self._cached('parenthesis', s, _strip_parenthesis)
+        s = self._cached('adpositions', s, lambda s: remove_adopositions(s, get_nlp()))
+        s = self._cached('singular', s, _get_singular)
         return self.find_closest_match(s)
 
+    def parse_many(self, strings, batch_size=BATCH_SIZE):
+        """
+        Given a list of input strings, return the ingredient part of each of
+        them like parse. The strings missing from the caches are run through
+        spacy in batches.
+        """
+
+        start = clock()
+        strings = list(strings)
+
+        if self.benchmark:
+            self.num_ingredients_parsed += len(strings)
+
+        parsed = [self.caches['parse'].get(s) for s in strings]
+        pending = [i for i, result in enumerate(parsed) if result is MISSING]
+
+        stripped = {i: self._cached('parenthesis', strings[i], _strip_parenthesis) for i in pending}
+
+        # Only the strings whose adpositions have never been removed go
+        # through spacy
+        tag_start = clock()
+        without_adpositions = dict()
+        to_tag = dict()
+        for s in stripped.values():
+            if s in without_adpositions or s in to_tag:
+                continue
+            result = self.caches['adpositions'].get(s)
+            if result is MISSING:
+                to_tag[s] = None
+            else:
+                without_adpositions[s] = result
+
+        for s, doc in zip(to_tag, get_nlp().pipe(list(to_tag), batch_size=batch_size)):
+            result = _remove_adpositions_from_doc(doc)
+            self.caches['adpositions'][s] = result
+            without_adpositions[s] = result
+        if stripped:
+            self.metrics.add('adpositions', clock() - tag_start, len(stripped))
+
+        for i in pending:
+            s = self._cached('singular', without_adpositions[stripped[i]], _get_singular)
+            parsed[i] = self.find_closest_match(s)
+            self.caches['parse'][strings[i]] = parsed[i]
+
+        if strings:
+            self.metrics.add('parse', clock() - start, len(strings))
+        return parsed
 
 if __name__ == '__main__':
 
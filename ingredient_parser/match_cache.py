@@ -0,0 +1,124 @@
+import hashlib
+import os
+import sqlite3
+from load_ingredients import INGREDIENTS_DIR
+from ingredient_index import THRESHOLD, MATCHING_THRESHOLD
+from stage_cache import MISSING
+
+MATCH_CACHE_PATH = os.path.join(os.path.dirname(INGREDIENTS_DIR), 'match_cache.sqlite')
+
+# Version of the matching code of IngredientParser, to increase whenever a
+# change of the scoring or of the candidates can change a match
+MATCHER_VERSION = 1
+
+
+def catalog_hash(ing_dir=INGREDIENTS_DIR):
+    """
+    Return a hash of the names and contents of the ingredient files under
+    ing_dir, which changes whenever the catalog is edited.
+    """
+    h = hashlib.sha1()
+    for file in sorted(os.listdir(ing_dir)):
+        if file not in ['.pytest_cache']:
+            h.update(file.encode('utf-8') + b'\0')
+            with open(os.path.join(ing_dir, file), 'rb') as f:
+                h.update(f.read() + b'\0')
+    return h.hexdigest()
+
+
+def matcher_key(ing_dir=INGREDIENTS_DIR, threshold=THRESHOLD, matching_threshold=MATCHING_THRESHOLD):
+    """
+    Return the key of the matches found with the catalog under ing_dir, the
+    thresholds and MATCHER_VERSION, which changes whenever any of them does.
+    """
+    return '{} {} {} {}'.format(catalog_hash(ing_dir), threshold, matching_threshold, MATCHER_VERSION)
+
+
+class MatchCache:
+    """
+    Map from normalized expression to the ingredient it matched that is
+    persisted in a sqlite database between runs. The cache is emptied when it
+    was written for a different version of the catalog, other thresholds or
+    another version of the matching code.
+
+    The matches are looked up in the database as they are needed, so memory
+    does not grow with the size of the cache; the IngredientParser keeps the
+    recent ones in the LRUCache of its match stage. New matches are kept in
+    memory until they are flushed.
+    """
+
+    # Number of new matches after which the process writing the cache should
+    # flush them
+    FLUSH_SIZE = 10000
+
+    def __init__(self, path=MATCH_CACHE_PATH, ing_dir=INGREDIENTS_DIR, threshold=THRESHOLD,
+                 matching_threshold=MATCHING_THRESHOLD):
+        self.path = path
+        self.key = matcher_key(ing_dir, threshold, matching_threshold)
+        self.new_matches = dict()
+        self.connection = None
+        self.pid = None
+
+    def _connect(self):
+        # A connection is not used across a fork, so worker processes open
+        # their own
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path)
+            self.pid = os.getpid()
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS matches (expression TEXT PRIMARY KEY, ingredient TEXT)')
+        return self.connection
+
+    def load(self):
+        connection = self._connect()
+        with connection:
+            row = connection.execute('SELECT value FROM meta WHERE key = ?', ('matcher',)).fetchone()
+            if row is None or row[0] != self.key:
+                # The catalog or the matching changed since the cache was
+                # written
+                connection.execute('DELETE FROM matches')
+                connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('matcher', self.key))
+        return self
+
+    def flush(self):
+        """
+        Write the matches added since the last load or flush to disk.
+        """
+        if not self.new_matches:
+            return
+        connection = self._connect()
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO matches VALUES (?, ?)', self.new_matches.items())
+        self.new_matches.clear()
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
+
+    def get(self, expression, default=None):
+        """
+        Return the ingredient expression matched, which is None when it
+        matched nothing, or default if it is not in the cache.
+        """
+        ingredient = self.new_matches.get(expression, MISSING)
+        if ingredient is not MISSING:
+            return ingredient
+        row = self._connect().execute('SELECT ingredient FROM matches WHERE expression = ?', (expression,)).fetchone()
+        return default if row is None else row[0]
+
+    def __contains__(self, expression):
+        return self.get(expression, MISSING) is not MISSING
+
+    def __getitem__(self, expression):
+        ingredient = self.get(expression, MISSING)
+        if ingredient is MISSING:
+            raise KeyError(expression)
+        return ingredient
+
+    def __setitem__(self, expression, ingredient):
+        self.new_matches[expression] = ingredient
+
+    def __len__(self):
+        count = self._connect().execute('SELECT COUNT(*) FROM matches').fetchone()[0]
+        return count + len(self.new_matches)
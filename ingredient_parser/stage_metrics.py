@@ -0,0 +1,118 @@
+import math
+import time
+
+# Resolution of LatencyHistogram: 16 buckets per doubling of the latency, so a
+# percentile is off by at most about 4%, from 1 microsecond up to about an hour
+BUCKETS_PER_DOUBLING = 16
+MIN_LATENCY = 1e-6
+NUM_BUCKETS = 32 * BUCKETS_PER_DOUBLING
+
+PERCENTILES = [50, 95, 99]
+
+clock = time.perf_counter
+
+
+class LatencyHistogram:
+    '''Counts of latencies in logarithmic buckets, so percentiles are
+    computed in constant memory whatever the number of samples
+    '''
+
+    __slots__ = ('counts',)
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+
+    @staticmethod
+    def bucket(seconds):
+        if seconds <= MIN_LATENCY:
+            return 0
+        return min(int(math.log2(seconds / MIN_LATENCY) * BUCKETS_PER_DOUBLING) + 1, NUM_BUCKETS - 1)
+
+    @staticmethod
+    def latency(bucket):
+        '''Return the upper bound of the latencies of bucket
+        '''
+        return MIN_LATENCY * 2 ** (bucket / BUCKETS_PER_DOUBLING)
+
+    def add(self, seconds, count=1):
+        self.counts[self.bucket(seconds)] += count
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+
+    def percentile(self, p):
+        total = sum(self.counts)
+        if total == 0:
+            return 0.0
+        rank = math.ceil(total * p / 100)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.latency(bucket)
+        return self.latency(NUM_BUCKETS - 1)
+
+
+class StageStats:
+    '''Number of items, cumulative time and latency histogram of a stage
+    '''
+
+    __slots__ = ('count', 'seconds', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.histogram = LatencyHistogram()
+
+    def merge(self, other):
+        self.count += other.count
+        self.seconds += other.seconds
+        self.histogram.merge(other.histogram)
+
+    def report(self):
+        report = {
+            'count': self.count,
+            'seconds': self.seconds,
+            'mean': self.seconds / self.count if self.count else 0.0,
+        }
+        for p in PERCENTILES:
+            report['p{}'.format(p)] = self.histogram.percentile(p)
+        return report
+
+
+class StageMetrics:
+    '''Per stage timings of the work done on the hot paths of the ingredient
+    parser and the database builder. Record a stage with
+
+        start = clock()
+        ...
+        metrics.add(stage, clock() - start)
+    '''
+
+    def __init__(self):
+        self.stages = dict()
+
+    def add(self, stage, seconds, count=1):
+        '''Record that stage processed count items in seconds. Each item is
+        counted in the histogram with the average latency.
+        '''
+        stats = self.stages.get(stage)
+        if stats is None:
+            stats = self.stages[stage] = StageStats()
+        stats.count += count
+        stats.seconds += seconds
+        if count:
+            stats.histogram.add(seconds / count, count)
+
+    def merge(self, other):
+        for stage, stats in other.stages.items():
+            if stage not in self.stages:
+                self.stages[stage] = StageStats()
+            self.stages[stage].merge(stats)
+
+    def report(self):
+        '''Return a dictionary from stage to its count, cumulative and mean
+        seconds and latency percentiles
+        '''
+        return {stage: stats.report() for stage, stats in self.stages.items()}
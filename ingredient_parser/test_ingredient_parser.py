@@ -1,9 +1,26 @@
 import pytest
+import json
+import os
+import pickle
+import subprocess
+import sys
 import ingredient_parser
+import ingredient_catalog
+from unittest.mock import patch
 
 
 parser = ingredient_parser.IngredientParser()
 
+# The startup time is measured by the startup stage of benchmark_suite.py
+STARTUP_SCRIPT = '''
+import json, sys
+import ingredient_parser
+ingredient_parser.IngredientParser()
+print(json.dumps({
+    'modules': [m for m in ['spacy', 'inflect', 'scipy', 'sklearn'] if m in sys.modules],
+}))
+'''
+
 class TestClass:
 
     def test_001(self):
@@ -59,3 +76,142 @@ class TestClass:
 
     def test_019(self):
         assert parser.parse(r"2 pounds skinless, boneless chicken breast halves") == "chicken breast"
+
+    def test_index_matches_exhaustive_scan(self):
+        expressions = [
+            r"1 1/4 cup all-purpose flour",
+            r"2 pound skinless, boneless chicken breast halve",
+            r"1 cup dicd tomatos",
+            r", diced ounce cup ground",
+            r"1/2 apple juic",
+            r"assorted colors coloring",
+        ]
+        for expression in expressions:
+            highest_score = float('-inf')
+            closest_match = None
+            for fixed_ingredient in parser.ingredients:
+                score = parser.get_score(expression, fixed_ingredient)
+                if score > highest_score or (score == highest_score and len(fixed_ingredient) > len(closest_match)):
+                    highest_score = score
+                    closest_match = fixed_ingredient
+            if highest_score < ingredient_parser.IngredientParser.MATCHING_THRESHOLD:
+                closest_match = None
+            else:
+                closest_match = parser.alias_map[closest_match]
+            assert parser.find_closest_match(expression) == closest_match
+
+    def test_token_trie(self):
+        assert parser.trie.matches(['boneless', 'chicken', 'breast']) == ['chicken breast']
+        assert parser.trie.matches(['garlic', 'powder', 'chicken', 'breast']) == ['garlic', 'garlic powder', 'chicken breast']
+        assert parser.trie.matches(['half', 'and']) == []
+
+        # The trie should resolve expressions to what the fuzzy scan finds
+        fuzzy_parser = ingredient_parser.IngredientParser()
+        fuzzy_parser.trie = None
+        expressions = [
+            r"chicken breast",
+            r"boneless chicken breast",
+            r"half and half",
+            r"chicken breast with garlic powder",
+            r"fresh sweet and sour sauce",
+            r"sour sweet sauce",
+            r"1 cup dicd tomatos",
+        ]
+        for expression in expressions:
+            assert parser.find_closest_match(expression) == fuzzy_parser.find_closest_match(expression)
+
+    def test_token_similarities(self):
+        expressions = [
+            r"2 pound skinless, boneless chicken breast halve",
+            r"1 cup dicd tomatos",
+            r"confectioners' sugar",
+        ]
+        for expression in expressions:
+            tokens = ingredient_parser.tokenize(expression)
+            tokens.reverse()
+            similarities = [parser.index.similarities(token) for token in tokens]
+
+            # Scoring from the similarities should match scoring token pairs
+            for fixed_ingredient in parser.ingredients:
+                compiled = parser.catalog[fixed_ingredient]
+                assert parser.score_tokens(tokens, compiled, similarities) == parser.get_score(expression, fixed_ingredient)
+
+    def test_catalog_snapshot(self, tmp_path, monkeypatch):
+        ing_dir = tmp_path / 'ingredients'
+        ing_dir.mkdir()
+        (ing_dir / 'dairy').write_text('butter\nmilk: whole milk\n')
+        (ing_dir / 'fruits').write_text('apple\n')
+        snapshot = str(tmp_path / 'catalog.pickle')
+
+        compiled = ingredient_catalog.read_catalog(str(ing_dir), snapshot=snapshot)
+        assert compiled.alias_map == {'butter': 'butter', 'milk': 'milk', 'whole milk': 'milk', 'apple': 'apple'}
+        assert sorted(compiled.categories) == ['dairy', 'fruits']
+
+        # An unchanged catalog should be read from the snapshot
+        with open(snapshot, 'rb') as f:
+            content = f.read()
+        catalog = ingredient_catalog.read_catalog(str(ing_dir), snapshot=snapshot)
+        assert catalog.ingredients == compiled.ingredients
+        assert catalog.trie.matches(['whole', 'milk']) == ['milk', 'whole milk']
+        with open(snapshot, 'rb') as f:
+            assert f.read() == content
+
+        # and an edited one compiled again
+        (ing_dir / 'fruits').write_text('apple\npear\n')
+        catalog = ingredient_catalog.read_catalog(str(ing_dir), snapshot=snapshot)
+        assert catalog.ingredients['pear'] == 'fruits'
+        assert ingredient_catalog.read_catalog(str(ing_dir), snapshot=snapshot).ingredients['pear'] == 'fruits'
+
+        # even when the edit keeps the size and modification time of the file
+        stat = os.stat(str(ing_dir / 'fruits'))
+        (ing_dir / 'fruits').write_text('apple\nplum\n')
+        os.utime(str(ing_dir / 'fruits'), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert 'plum' in ingredient_catalog.read_catalog(str(ing_dir), snapshot=snapshot).ingredients
+
+        # A change to the code of the catalog should compile it again too
+        source = tmp_path / 'token_trie.py'
+        source.write_text('# one version\n')
+        monkeypatch.setattr(ingredient_catalog, 'CATALOG_SOURCES', ingredient_catalog.CATALOG_SOURCES + [str(source)])
+        key = ingredient_catalog.snapshot_key(str(ing_dir))
+        source.write_text('# another version\n')
+        assert ingredient_catalog.snapshot_key(str(ing_dir)) != key
+        with patch.object(ingredient_catalog.IngredientCatalog, 'compile',
+                          side_effect=ingredient_catalog.IngredientCatalog.compile) as compile_catalog:
+            ingredient_catalog.read_catalog(str(ing_dir), snapshot=snapshot)
+            ingredient_catalog.read_catalog(str(ing_dir), snapshot=snapshot)
+        assert compile_catalog.call_count == 1
+
+        # as should a snapshot that cannot be unpickled, e.g. one written with
+        # a newer pickle protocol or referring to a module that is gone
+        key = pickle.dumps(ingredient_catalog.snapshot_key(str(ing_dir)))
+        for content in [b'\x80\x09', key + b'cno_such_module\nCatalog\n.']:
+            with open(snapshot, 'wb') as f:
+                f.write(content)
+            catalog = ingredient_catalog.read_catalog(str(ing_dir), snapshot=snapshot)
+            assert 'plum' in catalog.ingredients
+            with open(snapshot, 'rb') as f:
+                assert pickle.load(f) == ingredient_catalog.snapshot_key(str(ing_dir))
+
+        # The parsers of a process should share one catalog
+        assert ingredient_parser.IngredientParser().index is parser.index
+
+    def test_cache_bounds(self):
+        bounded_parser = ingredient_parser.IngredientParser(cache_size=1)
+        assert bounded_parser.parse(r"2 eggs") == "egg"
+        assert bounded_parser.parse(r"2 eggs") == "egg"
+        assert bounded_parser.parse_many([r"1/2 tablespoon butter, melted", r"2 eggs"]) == ["butter", "egg"]
+
+        info = bounded_parser.cache_info()['parse']
+        assert info.hits == 2
+        assert info.misses == 2
+        assert info.evictions == 1
+        assert info.currsize == 1
+
+    def test_startup(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c', STARTUP_SCRIPT],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        startup = json.loads(output)
+
+        # The heavy dependencies are only loaded by the first parse
+        assert startup['modules'] == []
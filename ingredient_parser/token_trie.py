@@ -0,0 +1,57 @@
+from ingredient_index import tokenize
+
+# Key of the list of ingredients ending at a node of TokenTrie, which cannot
+# clash with a token
+END = None
+
+
+class TokenTrie:
+    '''Trie over the sorted tokens of the catalog ingredients, which finds the
+    ingredients whose tokens all occur in an expression, e.g. "chicken breast"
+    and "chicken" in "boneless chicken breast".
+
+    Such an ingredient matches every one of its tokens exactly and scores the
+    maximum of get_score, while any other ingredient has a token scoring below
+    100 and loses at least the weight of that token. So the closest match is
+    among them whenever there is one, and the fuzzy scan is only needed for
+    the other expressions.
+    '''
+
+    def __init__(self, ingredients):
+        self.root = dict()
+        for i, ingredient in enumerate(ingredients):
+            tokens = tokenize(ingredient)
+
+            # The index skips empty tokens, so neither can find an ingredient
+            # without any other token
+            if not any(tokens):
+                continue
+
+            node = self.root
+            for token in sorted(tokens):
+                node = node.setdefault(token, dict())
+            node.setdefault(END, []).append(i)
+
+        self.ingredients = list(ingredients)
+
+    def matches(self, tokens):
+        '''Return the ingredients whose tokens, with their repetitions, all
+        occur in tokens, in catalog order
+        '''
+        tokens = sorted(tokens)
+        indices = []
+
+        # Walk every path of the trie spelled by a subsequence of the sorted
+        # tokens, skipping repeated tokens at the same depth
+        stack = [(self.root, 0)]
+        while stack:
+            node, start = stack.pop()
+            for j in range(start, len(tokens)):
+                if j > start and tokens[j] == tokens[j - 1]:
+                    continue
+                child = node.get(tokens[j])
+                if child is not None:
+                    indices.extend(child.get(END, ()))
+                    stack.append((child, j + 1))
+
+        return [self.ingredients[i] for i in sorted(indices)]
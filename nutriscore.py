@@ -1,41 +1,18 @@
+import argparse
 import pickle
 import numpy as np
-
-CSV_INDEX_TO_RELATIONSHIP = [
-    'id',
-    'url',
-    'title',
-    'img_url',
-    'servings',
-    'prep_time',
-    'rating',
-    'reviews',
-    'made_it_count',
-    'calories',
-    'total_fat',
-    'saturated_fat',
-    'cholesterol',
-    'sodium',
-    'potassium',
-    'total_carbohydrates',
-    'dietary_fiber',
-    'protein',
-    'sugars',
-    'vitamin_a',
-    'vitamin_c',
-    'calcium',
-    'iron',
-    'thiamin',
-    'niacin',
-    'vitamin_b6',
-    'magnesium',
-    'folate',
-    # Everything above this index is a <contains> relationship
-]
+from recipe_schema import CSV_INDEX_TO_RELATIONSHIP, FEATURES_START, FEATURES_END
 
 
 def load_model(filename):
+    """
+    Load a model saved by LinearModel.save, or else a pickled scikit-learn
+    model, which requires importing scikit-learn.
+    """
     with open(filename, 'rb') as f:
+        if f.read(len(NPZ_MAGIC)) == NPZ_MAGIC:
+            return LinearModel.load(filename)
+        f.seek(0)
         model = pickle.load(f)
     return model
 
@@ -59,7 +36,7 @@ def compute_aug_cols(data):
 
 
 def compute_input(recipe):
-    recipe_data = recipe[6:len(CSV_INDEX_TO_RELATIONSHIP)-1]
+    recipe_data = recipe[FEATURES_START:FEATURES_END]
     recipe_data = np.array(recipe_data).astype(np.float64)
 
     # Compute augmented features, the 1 is the bias term
@@ -71,3 +48,128 @@ def compute_input(recipe):
 
 def predict_nutriscore(model, recipe):
     return model.predict(compute_input(recipe).reshape(1, -1))[0]
+
+
+def compute_input_batch(recipes):
+    """
+    Return the feature matrix of a list of recipes, built like compute_input,
+    and a boolean mask of the rows whose macronutrient calories sum to zero,
+    whose augmented features cannot be computed.
+    """
+    recipe_data = np.array(
+        [recipe[FEATURES_START:FEATURES_END] for recipe in recipes], dtype=np.float64
+    ).reshape(len(recipes), FEATURES_END - FEATURES_START)
+    return compute_input_matrix(recipe_data)
+
+
+def compute_input_matrix(recipe_data):
+    """
+    Like compute_input_batch, given the columns FEATURES_START to FEATURES_END
+    of the recipes as a float64 matrix.
+    """
+    protein_cals = recipe_data[:, protein_index - FEATURES_START] * 4.0
+    fat_cals = recipe_data[:, fat_index - FEATURES_START] * 9.0
+    carb_cals = recipe_data[:, carb_index - FEATURES_START] * 4.0
+
+    total_cals = protein_cals + fat_cals + carb_cals
+    zero_division = total_cals == 0
+    total_cals[zero_division] = 1.0
+
+    # Augmented features, the 1 is the bias term
+    aug_cols = np.column_stack([
+        protein_cals / total_cals,
+        fat_cals / total_cals,
+        carb_cals / total_cals,
+        np.ones(len(recipe_data)),
+    ])
+
+    return np.hstack([recipe_data, aug_cols]), zero_division
+
+
+def predict_nutriscore_batch(model, recipes):
+    """
+    Return the nutrition scores of a list of recipes, computed with a single
+    matrix-vector product, and a boolean mask of the recipes whose score could
+    not be computed because their macronutrient calories sum to zero. The
+    scores of those recipes are nan.
+    """
+    return predict_nutriscore_matrix(model, compute_input_batch(recipes))
+
+
+def predict_nutriscore_matrix(model, recipe_input):
+    """
+    Like predict_nutriscore_batch, given the result of compute_input_batch or
+    compute_input_matrix.
+    """
+    recipe_data, zero_division = recipe_input
+    scores = recipe_data.dot(np.ravel(model.coef_)) + model.intercept_
+    scores[zero_division] = np.nan
+    return scores, zero_division
+
+
+# Names of the columns of the matrix computed by compute_input_batch
+FEATURES = CSV_INDEX_TO_RELATIONSHIP[FEATURES_START:FEATURES_END] + [
+    'cal_protein',
+    'cal_fat',
+    'cal_carbs',
+    'bias',
+]
+
+# .npz files are zip archives
+NPZ_MAGIC = b'PK\x03\x04'
+
+
+class LinearModel:
+    """
+    The coefficients of a linear regression, evaluated with numpy alone so
+    that loading it does not import scikit-learn.
+    """
+
+    def __init__(self, coef_, intercept_, features=FEATURES):
+        self.coef_ = np.ravel(np.asarray(coef_, dtype=np.float64))
+        self.intercept_ = float(intercept_)
+        self.features = list(features)
+
+        if len(self.coef_) != len(self.features):
+            raise ValueError('expected {} coefficients, got {}'.format(len(self.features), len(self.coef_)))
+
+    @staticmethod
+    def from_model(model):
+        return LinearModel(model.coef_, np.ravel(model.intercept_)[0])
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as data:
+            model = LinearModel(data['coef_'], data['intercept_'], data['features'].tolist())
+
+        if model.features != FEATURES:
+            raise ValueError('{} was trained on different features'.format(filename))
+        return model
+
+    def save(self, filename):
+        with open(filename, 'wb') as f:
+            np.savez(f, coef_=self.coef_, intercept_=self.intercept_, features=np.array(self.features))
+
+    def predict(self, X):
+        return np.asarray(X, dtype=np.float64).dot(self.coef_) + self.intercept_
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Script that converts a pickled nutriscore model to the .npz format')
+    parser.add_argument(
+        'input',
+        help='path to the pickled scikit-learn model',
+        type=str,
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        dest='output',
+        help='path to the output file',
+        default='nutriscore.npz',
+        type=str,
+    )
+    args = parser.parse_args()
+
+    LinearModel.from_model(load_model(args.input)).save(args.output)
@@ -0,0 +1,59 @@
+import collections
+import queue
+import threading
+
+
+def imap_ordered(pool, func, iterable, window):
+    """
+    Like pool.imap, but at most window items of iterable are submitted to the
+    pool ahead of the result being consumed, so a large input is read lazily
+    instead of being queued all at once. Results are yielded in input order.
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def prefetch(iterable, size):
+    """
+    Consume iterable in a background thread, at most size items ahead of the
+    items yielded, so producing the next items overlaps with processing the
+    current ones. Exceptions of iterable are raised by the generator.
+    """
+    items = queue.Queue(size)
+    done = object()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if stopped.is_set():
+                    return
+                items.put((item, None))
+        except BaseException as e:
+            items.put((done, e))
+            return
+        items.put((done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stopped.set()
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+
+
+class ParseManifest:
+    '''Records, for each recipe id, the signature of the html file the recipe
+    was last parsed from and the outcome of parsing it, so that unchanged
+    files can be skipped by the next run of parser.py.
+
+    The signature is the size and modification time of the file, or the
+    sha1 of its content if use_hash is set.
+    '''
+
+    def __init__(self, path, use_hash=False):
+        self.path = path
+        self.use_hash = use_hash
+        self.entries = dict()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        return self
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+    def signature(self, f_html, source=None):
+        '''Return the signature of the html file f_html, or of the html named
+        f_html in the HtmlSource source
+        '''
+        if source is not None:
+            if self.use_hash:
+                return 'sha1:' + source.digest(f_html)
+            return 'stat:{}:{}'.format(*source.stat(f_html))
+        if self.use_hash:
+            with open(f_html, 'rb') as f:
+                return 'sha1:' + hashlib.sha1(f.read()).hexdigest()
+        stat = os.stat(f_html)
+        return 'stat:{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+
+    def is_current(self, key, signature):
+        '''Whether the file with signature was already parsed for key
+        '''
+        entry = self.entries.get(key)
+        return entry is not None and entry['signature'] == signature
+
+    def record(self, key, f_html, signature, outcome):
+        self.entries[key] = {
+            'path': f_html,
+            'signature': signature,
+            'outcome': outcome,
+        }
@@ -2,12 +2,38 @@
 
 import argparse
 from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 import codecs
 import re
 import os
 import sys
 import traceback
 import csv
+import multiprocessing
+import functools
+import heapq
+from parallel import imap_ordered
+from html_sources import HtmlDirectory, HtmlSource, open_htmls
+from parse_manifest import ParseManifest
+from recipe_store import RecipeStore
+from recipe_ids import SeenIdSet, add_new, is_redirected
+from recipe_schema import Recipe
+
+# Outcomes of parsing a recipe html
+OK = 'ok'
+NO_NUTRITION = 'no-nutrition'
+REDIRECTED = 'redirected'
+FAILED = 'failed'
+
+# Number of files read ahead of the parsing for each job
+FILES_PER_JOB = 8
+
+# Outputs with this extension are written as a RecipeStore instead of csv
+STORE_EXTENSION = '.npz'
+
+# Url of the page in the html, found without building its tree
+CANONICAL_URL = re.compile(r'<link\b[^>]*\bid="canonicalUrl"[^>]*\bhref="([^"]*)"')
 
 
 class NoNutritionFactsException(Exception):
@@ -16,118 +42,439 @@ class NoNutritionFactsException(Exception):
     pass
 
 
-class Recipe:
-    separator = '|'  # used to separate ingredients
+class RedirectedRecipeException(Exception):
+    '''Thrown when the html file is the page of another recipe, because the
+    id it is named after was redirected to that recipe
+    '''
+    pass
 
-    def __init__(self):
-        self.id = 0
-        self.url = ''
-        self.name = ''
-        self.rating = 0
-        self.reviews = 0
-        self.made_it_count = 0
-        self.ingredients = list()
-        self.img_url = ''
-        self.servings = 0
-        self.prep_time = 0
-        self.nutrition_facts = {}
-        self.calories = 0  # calories/serving
 
-    def __str__(self):
-        return self.url
+def recipe_id_from_path(path):
+    '''Return the recipe id a html file is named after
+    '''
+    return int(path.split('/')[-1].replace('.html', ''))
 
-def parse_recipe_html(path):
-    '''Given a path to the html file, return a parsed recipe object
+
+class Html5libPage:
+    '''Finds the parts of a recipe page in a complete BeautifulSoup tree built
+    by html5lib
+    '''
+
+    def __init__(self, html):
+        self.soup = BeautifulSoup(html, features='html5lib')
+
+    def name(self):
+        return self.soup.find(id='recipe-main-content').text
+
+    def ingredients(self):
+        return [str(tag.contents[0]) for tag in self.soup.find_all(itemprop='recipeIngredient')]
+
+    def rating(self):
+        rating_div = self.soup.find_all('div', {'class': 'recipe-summary__stars'})[0]
+        return rating_div.find('img')['alt']
+
+    def reviews(self):
+        return self.soup.find('span', {'class': 'review-count'}).text
+
+    def made_it_count(self):
+        made_it_count_span = self.soup.find('span', {'class': 'made-it-count'})
+        # The count is located in the next sibling of the span with class 'made-it-count'
+        return made_it_count_span.find_next_sibling().text
+
+    def img_url(self):
+        return self.soup.find('img', {'class': 'rec-photo'})['src']
+
+    def url(self):
+        return self.soup.find(id='canonicalUrl')['href']
+
+    def servings(self):
+        return self.soup.find(id='metaRecipeServings')['content']
+
+    def prep_time(self):
+        return self.soup.find('span', {'class': 'ready-in-time'}).text
+
+    def calories(self):
+        return self.soup.find('span', {'itemprop': 'calories'}).text
+
+    def nutrition_rows(self):
+        return [
+            row.find('span', {'class': 'nutrient-name'}).text
+            for row in self.soup.find_all('div', {'class': 'nutrition-row'})
+        ]
+
+
+def _class_xpath(tag, cls):
+    return etree.XPath(
+        '//{}[contains(concat(" ", normalize-space(@class), " "), " {} ")]'.format(tag, cls))
+
+
+class LxmlPage:
+    '''Finds the parts of a recipe page with XPath queries on a libxml2 tree,
+    which is an order of magnitude faster to build than the html5lib one
+    '''
+
+    NAME = etree.XPath('//*[@id="recipe-main-content"]')
+    INGREDIENTS = etree.XPath('//*[@itemprop="recipeIngredient"]')
+    RATING = _class_xpath('div', 'recipe-summary__stars')
+    REVIEWS = _class_xpath('span', 'review-count')
+    MADE_IT_COUNT = _class_xpath('span', 'made-it-count')
+    IMG_URL = _class_xpath('img', 'rec-photo')
+    URL = etree.XPath('//*[@id="canonicalUrl"]')
+    SERVINGS = etree.XPath('//*[@id="metaRecipeServings"]')
+    PREP_TIME = _class_xpath('span', 'ready-in-time')
+    CALORIES = etree.XPath('//span[@itemprop="calories"]')
+    NUTRITION_ROWS = _class_xpath('div', 'nutrition-row')
+    NUTRIENT_NAME = etree.XPath('.//span[contains(concat(" ", normalize-space(@class), " "), " nutrient-name ")]')
+
+    def __init__(self, html):
+        self.root = lxml.html.document_fromstring(html)
+
+    @staticmethod
+    def _first(elements):
+        '''Return the first element like soup.find, or None
+        '''
+        return elements[0] if elements else None
+
+    @staticmethod
+    def _text(element):
+        if element is None:
+            raise AttributeError("'NoneType' object has no attribute 'text'")
+        return element.text_content()
+
+    def name(self):
+        return self._text(self._first(LxmlPage.NAME(self.root)))
+
+    def ingredients(self):
+        ingredients = []
+        for element in LxmlPage.INGREDIENTS(self.root):
+            # Same as the first child node of the element in BeautifulSoup
+            if element.text:
+                ingredients.append(element.text)
+            else:
+                ingredients.append(lxml.html.tostring(element[0], encoding='unicode', with_tail=False))
+        return ingredients
+
+    def rating(self):
+        rating_div = LxmlPage.RATING(self.root)[0]
+        return self._first(rating_div.findall('.//img')).attrib['alt']
+
+    def reviews(self):
+        return self._text(self._first(LxmlPage.REVIEWS(self.root)))
+
+    def made_it_count(self):
+        made_it_count_span = self._first(LxmlPage.MADE_IT_COUNT(self.root))
+        if made_it_count_span is None:
+            raise AttributeError("'NoneType' object has no attribute 'find_next_sibling'")
+        # Comments are elements in lxml, but not siblings in BeautifulSoup
+        sibling = self._first([e for e in made_it_count_span.itersiblings() if isinstance(e.tag, str)])
+        return self._text(sibling)
+
+    def img_url(self):
+        return self._first(LxmlPage.IMG_URL(self.root)).attrib['src']
+
+    def url(self):
+        return self._first(LxmlPage.URL(self.root)).attrib['href']
+
+    def servings(self):
+        return self._first(LxmlPage.SERVINGS(self.root)).attrib['content']
+
+    def prep_time(self):
+        return self._text(self._first(LxmlPage.PREP_TIME(self.root)))
+
+    def calories(self):
+        return self._text(self._first(LxmlPage.CALORIES(self.root)))
+
+    def nutrition_rows(self):
+        return [
+            self._text(self._first(LxmlPage.NUTRIENT_NAME(row)))
+            for row in LxmlPage.NUTRITION_ROWS(self.root)
+        ]
+
+
+# Extraction backends of parse_recipe, by name
+BACKENDS = {
+    'html5lib': Html5libPage,
+    'lxml': LxmlPage,
+}
+DEFAULT_BACKEND = 'html5lib'
+
+
+def parse_recipe(recipe_id, html, backend=DEFAULT_BACKEND):
+    '''Given the id of a recipe and the content of its html file, return a
+    parsed recipe object
     '''
 
     recipe = Recipe()
 
-    recipe.id = int(path.split('/')[-1].replace('.html', ''))
-    with codecs.open(path, 'r', 'utf-8') as f:
-        soup = BeautifulSoup(f.read(), features='html5lib')
+    # A redirected page duplicates another recipe, so it is dropped before
+    # extracting anything else, and before building the tree if possible
+    match = CANONICAL_URL.search(html)
+    if match is not None and is_redirected(recipe_id, match.group(1)):
+        raise RedirectedRecipeException
+
+    recipe.id = recipe_id
+    page = BACKENDS[backend](html)
+
+    # Recipe URL
+    recipe.url = page.url()
+    if is_redirected(recipe_id, recipe.url):
+        raise RedirectedRecipeException
 
-        # Name
-        recipe.name = soup.find(id='recipe-main-content').text
+    # Name
+    recipe.name = page.name()
 
-        # Ingredients
-        for tag in soup.find_all(itemprop='recipeIngredient'):
-            recipe.ingredients.append(tag.contents[0])
+    # Ingredients
+    recipe.ingredients = page.ingredients()
 
-        # Rating
-        rating_div = soup.findAll('div', {'class': 'recipe-summary__stars'})[0]
-        rating_string = rating_div.find('img')['alt']
+    # Rating
+    rating_string = page.rating()
+    result = re.search(
+        r'Rated as (\d+(?:\.\d{1,2})?) out of 5 Stars', rating_string)
+    recipe.rating = float(result.groups(1)[0])
+
+    # Reviews
+    reviews_str = page.reviews()
+    match = re.search(r'(\d+) review(?:s)?', reviews_str)
+    if match:
+        recipe.made_it_count = int(match.groups(1)[0])
+        recipe.reviews = int(match.groups(1)[0])
+    else:
+        match = re.search(r'(\d)k review(?:s)?', reviews_str)
+        recipe.reviews = int(match.groups(1)[0]) * 1000
+
+    # Made it count
+    made_it_count_str = page.made_it_count()
+    match = re.search(r'(\d+).made it', made_it_count_str)
+    if match:
+        recipe.made_it_count = int(match.groups(1)[0])
+    else:
+        match = re.search(r'(\d)k.made it', made_it_count_str)
+        recipe.made_it_count = int(match.groups(1)[0]) * 1000
+
+    # Image URL
+    recipe.img_url = page.img_url()
+
+    # Servings
+    recipe.servings = (int)(page.servings())
+
+    # Prep Time
+    # The prep time string can be one of the following forms:
+    # prep_time_string = '1 h 10 m'
+    # prep_time_string = '45 m'
+    try:
+        prep_time_string = page.prep_time()
         result = re.search(
-            r'Rated as (\d+(?:\.\d{1,2})?) out of 5 Stars', rating_string)
-        recipe.rating = float(result.groups(1)[0])
-
-        # Reviews
-        reviews_str = soup.find(
-            'span', {'class': 'review-count'}).text
-        match = re.search(r'(\d+) review(?:s)?', reviews_str)
-        if match:
-            recipe.made_it_count = int(match.groups(1)[0])
-            recipe.reviews = int(match.groups(1)[0])
+            r'(?:(\d{1,2}) h )?(\d{1,2}) m', prep_time_string)
+        if (result.groups()[0]):
+            h = (int)(result.groups()[0])
         else:
-            match = re.search(r'(\d)k review(?:s)?', reviews_str)
-            recipe.reviews = int(match.groups(1)[0]) * 1000
+            h = 0
+        m = (int)(result.groups()[1])
+        recipe.prep_time = h * 60 + m
+    except AttributeError:
+        recipe.prep_time = 0
 
-        # Made it count
-        made_it_count_span = soup.find(
-            'span', {'class': 'made-it-count'})
-        # The count is located in the next sibling of the span with class 'made-it-count'
-        made_it_count_str = made_it_count_span.find_next_sibling().text
-        match = re.search(r'(\d+).made it', made_it_count_str)
-        if match:
-            recipe.made_it_count = int(match.groups(1)[0])
-        else:
-            match = re.search(r'(\d)k.made it', made_it_count_str)
-            recipe.made_it_count = int(match.groups(1)[0]) * 1000
+    try:
+        recipe.calories = int(
+            re.search(
+                r'(\d+) calories',
+                page.calories()
+            ).group(1)
+        )
+        for row in page.nutrition_rows():
+            name, quantity = row.split(':')
+            name = name.lower().replace(' ', '_')
+            quantity.strip()
+            quantity = re.search(u'(?P<quantity>[\d.]+).*', quantity).group('quantity')
+            recipe.set_nutrient(name, float(quantity))
+    except:
+        raise(NoNutritionFactsException)
 
-        # Image URL
-        recipe.img_url = soup.find('img', {'class': 'rec-photo'})['src']
+    missing = recipe.missing_nutrients()
+    if missing:
+        raise ValueError('missing nutrition facts: {}'.format(', '.join(missing)))
 
-        # Recipe URL
-        recipe.url = soup.find(id='canonicalUrl')['href']
+    return recipe
 
-        # Servings
-        recipe.servings = (int)(soup.find(id='metaRecipeServings')['content'])
 
-        # Prep Time
-        # The prep time string can be one of the following forms:
-        # prep_time_string = '1 h 10 m'
-        # prep_time_string = '45 m'
+def parse_recipe_html(path, backend=DEFAULT_BACKEND):
+    '''Given a path to the html file, return a parsed recipe object
+    '''
+    with codecs.open(path, 'r', 'utf-8') as f:
+        return parse_recipe(recipe_id_from_path(path), f.read(), backend)
+
+
+def recipe_to_row(recipe):
+    '''Return the csv row of a parsed recipe
+    '''
+    return recipe.to_row()
+
+
+def manifest_key(f_html):
+    '''Return the key of a html file in the parse manifest, its recipe id
+    '''
+    try:
+        return str(recipe_id_from_path(f_html))
+    except ValueError:
+        return f_html
+
+
+def find_recipe_htmls(path):
+    '''Return the paths of the html files under path, sorted by recipe id.
+    When several files have the same recipe id, only the one with the
+    greatest path (the latest download folder) is returned.
+
+    path is a folder or an HtmlSource, whose html names are returned instead.
+    '''
+    def sort_key(f_html):
         try:
-            prep_time_string = soup.find(
-                'span', {'class': 'ready-in-time'}).text
-            result = re.search(
-                r'(?:(\d{1,2}) h )?(\d{1,2}) m', prep_time_string)
-            if (result.groups()[0]):
-                h = (int)(result.groups()[0])
+            return (0, recipe_id_from_path(f_html), f_html)
+        except ValueError:
+            return (1, 0, f_html)
+
+    source = path if isinstance(path, HtmlSource) else HtmlDirectory(path)
+    f_htmls = sorted(source.names(), key=sort_key)
+
+    latest = dict()
+    for f_html in f_htmls:
+        latest[manifest_key(f_html)] = f_html
+
+    return [f_html for f_html in f_htmls if latest[manifest_key(f_html)] == f_html]
+
+
+def _parse_html(item, backend=DEFAULT_BACKEND, records=False):
+    '''Return the outcome of parsing a html file and its csv row, or its
+    Recipe record if records is true
+    '''
+    f_html, html = item
+    try:
+        if html is None:
+            return f_html, FAILED, None
+        recipe = parse_recipe(recipe_id_from_path(f_html), html, backend)
+        return f_html, OK, recipe if records else recipe_to_row(recipe)
+    except NoNutritionFactsException:
+        return f_html, NO_NUTRITION, None
+    except RedirectedRecipeException:
+        return f_html, REDIRECTED, None
+    except Exception:
+        # print(traceback.format_exc())
+        return f_html, FAILED, None
+
+
+def parse_recipe_htmls(f_htmls, jobs=1, backend=DEFAULT_BACKEND, source=None, records=False, pool=None):
+    '''Parse the html files in jobs processes and yield the path, outcome and
+    csv row of each of them in the order of f_htmls. The htmls are read from
+    the HtmlSource source if they are not files. If records is true, the
+    Recipe records are yielded instead of their rows. pool is an optional
+    pool of jobs processes to parse in, created by the caller.
+    '''
+    if source is None:
+        source = HtmlDirectory(None)
+    items = source.read_many(f_htmls)
+    parse_html = functools.partial(_parse_html, backend=backend, records=records)
+    if pool is not None:
+        # Files are read by this process ahead of the parsing in the pool
+        for result in imap_ordered(pool, parse_html, items, jobs * FILES_PER_JOB):
+            yield result
+    elif jobs > 1:
+        with multiprocessing.Pool(jobs) as pool:
+            for result in imap_ordered(pool, parse_html, items, jobs * FILES_PER_JOB):
+                yield result
+    else:
+        for item in items:
+            yield parse_html(item)
+
+
+def _row_key(row):
+    try:
+        return (0, int(row[0]))
+    except ValueError:
+        return (1, 0)
+
+
+def _read_rows(path):
+    if path.endswith(STORE_EXTENSION):
+        yield from RecipeStore.load(path).rows()
+    else:
+        with open(path, 'r') as f:
+            yield from csv.reader(f, delimiter=',', quoting=csv.QUOTE_ALL)
+
+
+def _read_csv_rows(path, replaced_keys):
+    '''Yield the rows of an existing csv file or recipe store, except those
+    whose recipe id is in replaced_keys, duplicates and redirected recipes
+    written by older versions
+    '''
+    if not os.path.exists(path):
+        return
+    seen = SeenIdSet()
+    for row in _read_rows(path):
+        if row[0] not in replaced_keys and not is_redirected(row[0], row[1]) and add_new(seen, row[0]):
+            yield row
+
+
+def is_seen(f_html, seen):
+    '''Whether the recipe of a html file is in the SeenIdSet seen
+    '''
+    try:
+        return recipe_id_from_path(f_html) in seen
+    except ValueError:
+        return False
+
+
+def parse_to_csv(path, output, manifest, jobs=1, backend=DEFAULT_BACKEND, seen=None):
+    '''Parse the html files under path that changed since they were recorded
+    in the manifest, and update the rows of their recipes in the csv file
+    output, or the RecipeStore if output ends with .npz. Return the number of
+    files parsed, parsed successfully and skipped.
+
+    path is a folder, a tar or zip archive or a bundle of htmls. The htmls of
+    the recipes in the SeenIdSet seen, which were already built, are skipped.
+    '''
+    with open_htmls(path) as source:
+        return _parse_to_csv(source, output, manifest, jobs, backend, seen)
+
+
+def _parse_to_csv(source, output, manifest, jobs, backend, seen):
+    f_htmls = find_recipe_htmls(source)
+    unseen = f_htmls
+    if seen is not None:
+        unseen = [f_html for f_html in f_htmls if not is_seen(f_html, seen)]
+    signatures = {f_html: manifest.signature(f_html, source) for f_html in unseen}
+    changed = [f_html for f_html in unseen if not manifest.is_current(manifest_key(f_html), signatures[f_html])]
+    changed_keys = set(manifest_key(f_html) for f_html in changed)
+
+    counts = {'total': 0, 'success': 0}
+
+    def parsed_rows():
+        for f_html, outcome, row in parse_recipe_htmls(changed, jobs, backend, source):
+            counts['total'] += 1
+            file = os.path.basename(f_html)
+            manifest.record(manifest_key(f_html), f_html, signatures[f_html], outcome)
+            if outcome == OK:
+                counts['success'] += 1
+                yield row
+            elif outcome == NO_NUTRITION:
+                print('No nutrition facts for {}'.format(file))
+            elif outcome == REDIRECTED:
+                print('Redirected {}'.format(file))
             else:
-                h = 0
-            m = (int)(result.groups()[1])
-            recipe.prep_time = h * 60 + m
-        except AttributeError:
-            recipe.prep_time = 0
+                print('Failed', file)
 
-        try:
-            recipe.calories = int(
-                re.search(
-                    r'(\d+) calories',
-                    soup.find('span', {'itemprop': 'calories'}).text
-                ).group(1)
-            )
-            for row in soup.find_all('div', {'class': 'nutrition-row'}):
-                row = row.find('span', {'class': 'nutrient-name'})
-                name, quantity = row.text.split(':')
-                name = name.lower().replace(' ', '_')
-                quantity.strip()
-                quantity = re.search(u'(?P<quantity>[\d.]+).*', quantity).group('quantity')
-                recipe.nutrition_facts[name] = float(quantity)
-        except:
-            raise(NoNutritionFactsException)
-
-        return recipe
+    # The rows of the changed recipes are replaced, the rest is kept
+    tmp_output = output + '.tmp'
+    rows = heapq.merge(_read_csv_rows(output, changed_keys), parsed_rows(), key=_row_key)
+    if output.endswith(STORE_EXTENSION):
+        RecipeStore.from_rows(rows).save(tmp_output)
+    else:
+        with open(tmp_output, 'w') as f:
+            writer = csv.writer(f, delimiter=',', quoting=csv.QUOTE_ALL)
+            for row in rows:
+                writer.writerow(row)
+    os.replace(tmp_output, output)
+    manifest.save()
+
+    return counts['total'], counts['success'], len(f_htmls) - len(changed)
 
 
 if __name__ == '__main__':
@@ -136,7 +483,7 @@ if __name__ == '__main__':
         description='Script to parse raw recipe htmls')
     parser.add_argument(
         'path',
-        help='path to the folder of the htmls',
+        help='path to the folder of the htmls, a tar or zip archive of them or a bundle packed by html_sources.py',
         action='store',
         type=str
     )
@@ -144,61 +491,64 @@ if __name__ == '__main__':
         '-o',
         '--output',
         dest='output',
-        help='path to the output file',
+        help='path to the output csv file, or .npz recipe store',
         default='htmls.csv',
         type=str,
     )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        dest='jobs',
+        help='number of processes parsing htmls',
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        '-b',
+        '--backend',
+        dest='backend',
+        help='library used to extract recipes from the htmls',
+        choices=sorted(BACKENDS),
+        default=DEFAULT_BACKEND,
+        type=str,
+    )
+    parser.add_argument(
+        '-m',
+        '--manifest',
+        dest='manifest',
+        help='path to the manifest of the parsed htmls (default: OUTPUT.manifest.json)',
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        '--hash',
+        dest='hash',
+        help='detect changed htmls by their content instead of their size and modification time',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--full',
+        dest='full',
+        help='parse every html, even the ones recorded in the manifest',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--seen',
+        dest='seen',
+        help='skip the htmls of the recipes in this seen-id set, written by build_database.py --seen',
+        default=None,
+        type=str,
+    )
     args = parser.parse_args()
 
-    total = 0
-    success = 0
-    with open(args.output, 'a') as f:
-        writer = csv.writer(f, delimiter=',', quoting=csv.QUOTE_ALL)
-        for (root, dirs, files) in os.walk(args.path, topdown=True):
-            for file in files:
-                if file.endswith('.html'):
-                    try:
-                        total = total + 1
-                        f_html = os.path.join(root, file)
-                        recipe = parse_recipe_html(f_html)
-                        row = [
-                            recipe.id,
-                            recipe.url,
-                            recipe.name,
-                            recipe.img_url,
-                            recipe.servings,
-                            recipe.prep_time,
-                            recipe.rating,
-                            recipe.reviews,
-                            recipe.made_it_count,
-                            recipe.calories,
-                            recipe.nutrition_facts['total_fat'],
-                            recipe.nutrition_facts['saturated_fat'],
-                            recipe.nutrition_facts['cholesterol'],
-                            recipe.nutrition_facts['sodium'],
-                            recipe.nutrition_facts['potassium'],
-                            recipe.nutrition_facts['total_carbohydrates'],
-                            recipe.nutrition_facts['dietary_fiber'],
-                            recipe.nutrition_facts['protein'],
-                            recipe.nutrition_facts['sugars'],
-                            recipe.nutrition_facts['vitamin_a'],
-                            recipe.nutrition_facts['vitamin_c'],
-                            recipe.nutrition_facts['calcium'],
-                            recipe.nutrition_facts['iron'],
-                            recipe.nutrition_facts['thiamin'],
-                            recipe.nutrition_facts['niacin'],
-                            recipe.nutrition_facts['vitamin_b6'],
-                            recipe.nutrition_facts['magnesium'],
-                            recipe.nutrition_facts['folate'],
-                        ]
-                        row += recipe.ingredients
-                        writer.writerow(row)
-                        success = success + 1
-                    except KeyboardInterrupt:
-                        sys.exit()
-                    except NoNutritionFactsException:
-                        print('No nutrition facts for {}'.format(file))
-                    except Exception as e:
-                        print('Failed', file)
-                        # print(traceback.format_exc())
+    manifest = ParseManifest(args.manifest or args.output + '.manifest.json', args.hash)
+    if not args.full:
+        manifest.load()
+    seen = SeenIdSet.load(args.seen) if args.seen else None
+
+    try:
+        total, success, skipped = parse_to_csv(args.path, args.output, manifest, args.jobs, args.backend, seen)
+    except KeyboardInterrupt:
+        sys.exit()
+    print('Skipped {} unchanged htmls'.format(skipped))
     print('{}/{} succeeded!'.format(success, total))
@@ -0,0 +1,192 @@
+# Streams recipes from the downloaded htmls to the database file, without
+# writing htmls.csv in between
+
+import argparse
+import csv
+import multiprocessing
+import os
+from build_database import DatabaseBuilder
+from formatters import FORMATTERS
+from html_sources import open_htmls
+from ingredient_parser import IngredientParser
+from match_cache import MATCH_CACHE_PATH
+from parallel import prefetch
+from rdf_writer import RdfWriter, ShardedFile
+import recipe_parser
+from recipe_ids import SeenIdSet
+from recipe_schema import csv_values
+
+# Number of parsed recipes waiting to be built before parsing blocks
+QUEUE_SIZE = 1024
+
+
+def parsed_recipes(path, jobs=1, backend=recipe_parser.DEFAULT_BACKEND, f_csv=None, seen=None, pool=None):
+    '''Parse the html files under path, a folder, an archive or a bundle, in
+    jobs processes, or in the pool of jobs processes pool, and yield the
+    Recipe record of each recipe parsed successfully. Their rows are also
+    written to the file object f_csv if it is given. The htmls of the recipes
+    in the SeenIdSet seen are skipped.
+    '''
+    writer = None
+    if f_csv is not None:
+        writer = csv.writer(f_csv, delimiter=',', quoting=csv.QUOTE_ALL)
+
+    with open_htmls(path) as source:
+        f_htmls = recipe_parser.find_recipe_htmls(source)
+        if seen is not None:
+            f_htmls = [f_html for f_html in f_htmls if not recipe_parser.is_seen(f_html, seen)]
+        for f_html, outcome, recipe in recipe_parser.parse_recipe_htmls(f_htmls, jobs, backend, source, True, pool):
+            file = os.path.basename(f_html)
+            if outcome == recipe_parser.OK:
+                if writer is not None:
+                    writer.writerow(csv_values(recipe.to_row()))
+                yield recipe
+            elif outcome == recipe_parser.NO_NUTRITION:
+                print('No nutrition facts for {}'.format(file))
+            elif outcome == recipe_parser.REDIRECTED:
+                print('Redirected {}'.format(file))
+            else:
+                print('Failed', file)
+
+
+def run(path, builder, jobs=1, backend=recipe_parser.DEFAULT_BACKEND, f_csv=None, queue_size=QUEUE_SIZE):
+    '''Build the database of the html files under path with builder. The htmls
+    are parsed in jobs processes while the builder processes the previous
+    recipes with its own workers. The recipes already in builder.seen are
+    not parsed.
+    '''
+    if jobs <= 1:
+        builder.build_recipes(prefetch(parsed_recipes(path, jobs, backend, f_csv, builder.seen), queue_size))
+        return
+
+    # The htmls are parsed from a background thread while the builder and
+    # the writer run threads of their own, and forking a process with
+    # several threads can deadlock its children, so the parse pool is
+    # created here and spawned instead
+    with multiprocessing.get_context('spawn').Pool(jobs) as pool:
+        recipes = parsed_recipes(path, jobs, backend, f_csv, builder.seen, pool)
+        builder.build_recipes(prefetch(recipes, queue_size))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Script that builds the database file directly from a folder of recipe htmls')
+    parser.add_argument(
+        'path',
+        help='path to the folder of the htmls, a tar or zip archive of them or a bundle packed by html_sources.py',
+        type=str,
+    )
+    parser.add_argument(
+        '-o',
+        '--output',
+        dest='output',
+        help='path to the output file, gzip compressed if it ends with .gz, recipedia.rdf or recipedia.json by default',
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        '-f',
+        '--format',
+        dest='format',
+        help='format of the output',
+        choices=sorted(FORMATTERS),
+        default='rdf',
+        type=str,
+    )
+    parser.add_argument(
+        '--shard-size',
+        dest='shard_size',
+        help='split the output into files of about this many MB, e.g. recipedia-0000.rdf',
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        '--csv',
+        dest='csv',
+        help='also write the parsed recipes to this csv file, for debugging',
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        dest='jobs',
+        help='number of processes parsing htmls',
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        '-b',
+        '--backend',
+        dest='backend',
+        help='library used to extract recipes from the htmls',
+        choices=sorted(recipe_parser.BACKENDS),
+        default=recipe_parser.DEFAULT_BACKEND,
+        type=str,
+    )
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest='workers',
+        help='number of worker processes parsing ingredients',
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        '-q',
+        '--queue-size',
+        dest='queue_size',
+        help='number of parsed recipes waiting to be built before parsing blocks',
+        default=QUEUE_SIZE,
+        type=int,
+    )
+    parser.add_argument(
+        '-m',
+        '--model',
+        dest='model',
+        help='path to a nutriscore model, saved in the .npz format or pickled',
+        default='nutriscore.npz',
+        type=str
+    )
+    parser.add_argument(
+        '-c',
+        '--match-cache',
+        dest='match_cache',
+        help='path to the persistent ingredient match cache, empty to disable it',
+        default=MATCH_CACHE_PATH,
+        type=str
+    )
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        help='maximum number of entries of each ingredient parsing cache',
+        default=IngredientParser.CACHE_SIZE,
+        type=int
+    )
+    parser.add_argument(
+        '--seen',
+        dest='seen',
+        help='path to the set of the ids of the recipes built, which are skipped and to which the new ones are added',
+        default=None,
+        type=str
+    )
+    args = parser.parse_args()
+
+    if args.output is None:
+        args.output = 'recipedia' + FORMATTERS[args.format].extension
+    shard_size = args.shard_size * 2 ** 20 if args.shard_size else None
+
+    f_csv = open(args.csv, 'w') if args.csv else None
+    try:
+        with RdfWriter(ShardedFile(args.output, shard_size)) as f_output:
+            builder = DatabaseBuilder(None, f_output, args.model, match_cache=args.match_cache,
+                                      cache_size=args.cache_size, workers=args.workers,
+                                      output_format=args.format,
+                                      seen=SeenIdSet.load(args.seen) if args.seen else None)
+            run(args.path, builder, args.jobs, args.backend, f_csv, args.queue_size)
+            builder.statistics()
+        if args.seen:
+            builder.seen.save(args.seen)
+    finally:
+        if f_csv is not None:
+            f_csv.close()
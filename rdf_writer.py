@@ -0,0 +1,138 @@
+import gzip
+import os
+import queue
+import threading
+
+# Number of characters buffered before they are handed to the writer thread
+BUFFER_SIZE = 1 << 20
+
+# Number of buffers waiting to be written before write blocks
+MAX_PENDING = 8
+
+# Compression level of .gz outputs, trading a little size for speed
+GZIP_LEVEL = 6
+
+
+def shard_path(path, n):
+    '''Return the path of the nth shard of path, e.g. recipedia-0001.rdf.gz
+    for recipedia.rdf.gz
+    '''
+    if path.endswith('.gz'):
+        root, ext = os.path.splitext(path[:-len('.gz')])
+        ext += '.gz'
+    else:
+        root, ext = os.path.splitext(path)
+    return '{}-{:04d}{}'.format(root, n, ext)
+
+
+class ShardedFile:
+    '''A utf-8 text file, gzip compressed if its path ends with .gz, that is
+    split into files of about shard_size bytes on disk if shard_size is set.
+    A shard only ends between two writes, so a write is never split across
+    files.
+    '''
+
+    def __init__(self, path, shard_size=None):
+        self.path = path
+        self.shard_size = shard_size
+        self.paths = []
+        self.f = None
+        # The file on disk, under the gzip stream of a .gz path
+        self.raw = None
+
+    def _close(self):
+        self.f.close()
+        if self.raw is not self.f:
+            self.raw.close()
+
+    def _open_next(self):
+        if self.f is not None:
+            self._close()
+
+        path = self.path
+        if self.shard_size is not None:
+            path = shard_path(self.path, len(self.paths))
+
+        self.raw = open(path, 'wb')
+        if path.endswith('.gz'):
+            self.f = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=GZIP_LEVEL)
+        else:
+            self.f = self.raw
+        self.paths.append(path)
+
+    def write(self, s):
+        if self.f is None or (self.shard_size is not None and self.raw.tell() >= self.shard_size):
+            self._open_next()
+        self.f.write(s.encode('utf-8'))
+        if self.shard_size is not None and self.f is not self.raw:
+            # Emit what the compressor holds, so the size of the shard on disk
+            # is current. Writes are the large buffers of RdfWriter, so this
+            # barely changes the compression
+            self.f.flush()
+
+    def close(self):
+        if self.f is None:
+            self._open_next()
+        self._close()
+
+
+class RdfWriter:
+    '''Collects the output of DatabaseBuilder into large buffers that a
+    background thread writes to f, so formatting the next recipes overlaps
+    with writing and compressing the previous ones. f is closed by close.
+    '''
+
+    def __init__(self, f, buffer_size=BUFFER_SIZE, max_pending=MAX_PENDING):
+        self.f = f
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.buffered = 0
+        self.pending = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._write_pending, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_pending(self):
+        while True:
+            data = self.pending.get()
+            if data is None:
+                break
+            # After an error, keep draining so write never blocks forever
+            if self.error is None:
+                try:
+                    self.f.write(data)
+                except Exception as e:
+                    self.error = e
+
+    def _check_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, s):
+        self.buffer.append(s)
+        self.buffered += len(s)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self._check_error()
+        if self.buffer:
+            self.pending.put(''.join(self.buffer))
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.flush()
+        self.pending.put(None)
+        self.thread.join()
+        self.thread = None
+        self.f.close()
+        self._check_error()
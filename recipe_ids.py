@@ -0,0 +1,74 @@
+import os
+
+
+def recipe_id_from_url(url):
+    '''Return the recipe id of a recipe url, as a string, e.g. '13938' for
+    https://www.allrecipes.com/recipe/13938/connies-zucchini-crab-cakes/
+    '''
+    return url.split('/')[-3]
+
+
+def is_redirected(recipe_id, url):
+    '''Whether the page of recipe_id is the page of another recipe, because
+    allrecipes.com redirected its id to the url of that recipe
+    '''
+    return str(recipe_id) != recipe_id_from_url(url)
+
+
+def add_new(seen, recipe_id):
+    '''Add a recipe id to the SeenIdSet seen and return whether it was not
+    already in it. A value that is not a recipe id, e.g. of an odd row of an
+    old csv file, is always new, so its rows are kept but not deduplicated.
+    '''
+    try:
+        return seen.add(recipe_id)
+    except ValueError:
+        return True
+
+
+class SeenIdSet:
+    '''Set of recipe ids as a bitmap, one bit per id up to the largest id
+    added, so the 270k allrecipes.com ids take 33kB. Saved as the raw bitmap.
+    '''
+
+    def __init__(self, bits=None):
+        self.bits = bytearray() if bits is None else bytearray(bits)
+
+    @staticmethod
+    def load(path):
+        if not os.path.exists(path):
+            return SeenIdSet()
+        with open(path, 'rb') as f:
+            return SeenIdSet(f.read())
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self.bits)
+        os.replace(tmp_path, path)
+
+    def __contains__(self, recipe_id):
+        try:
+            recipe_id = int(recipe_id)
+        except ValueError:
+            return False
+        byte = recipe_id >> 3
+        return 0 <= byte < len(self.bits) and self.bits[byte] >> (recipe_id & 7) & 1 == 1
+
+    def add(self, recipe_id):
+        '''Add a recipe id and return whether it was not already in the set
+        '''
+        recipe_id = int(recipe_id)
+        if recipe_id < 0:
+            raise ValueError('negative recipe id {}'.format(recipe_id))
+        byte = recipe_id >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        mask = 1 << (recipe_id & 7)
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        return True
+
+    def __len__(self):
+        return sum(bin(byte).count('1') for byte in self.bits)
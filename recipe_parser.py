@@ -0,0 +1,12 @@
+# parser.py under a name that does not clash with the built-in parser module
+# of older Pythons. Importing this module imports parser.py in its place.
+
+import importlib.util
+import os
+import sys
+
+_spec = importlib.util.spec_from_file_location(
+    __name__, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser.py'))
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
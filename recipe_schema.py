@@ -0,0 +1,165 @@
+# Columns of the csv rows of the recipes, and the Recipe record parser.py
+# fills, shared by the parser, nutriscore and the DatabaseBuilder
+
+import math
+import numpy as np
+
+CSV_INDEX_TO_RELATIONSHIP = [
+    'id',
+    'url',
+    'title',
+    'img_url',
+    'servings',
+    'prep_time',
+    'rating',
+    'reviews',
+    'made_it_count',
+    'calories',
+    'total_fat',
+    'saturated_fat',
+    'cholesterol',
+    'sodium',
+    'potassium',
+    'total_carbohydrates',
+    'dietary_fiber',
+    'protein',
+    'sugars',
+    'vitamin_a',
+    'vitamin_c',
+    'calcium',
+    'iron',
+    'thiamin',
+    'niacin',
+    'vitamin_b6',
+    'magnesium',
+    'folate',
+    # Everything above this index is a <contains> relationship
+]
+
+# Column of the first ingredient of a row
+INGREDIENTS_START = len(CSV_INDEX_TO_RELATIONSHIP)
+
+# Nutrients of the nutrition facts of a page, in the order of their columns
+NUTRITION_START = CSV_INDEX_TO_RELATIONSHIP.index('total_fat')
+NUTRIENTS = CSV_INDEX_TO_RELATIONSHIP[NUTRITION_START:]
+NUTRIENT_INDEX = {name: i for i, name in enumerate(NUTRIENTS)}
+
+# Columns of a row used as nutriscore features, which leave out folate
+FEATURES_START = CSV_INDEX_TO_RELATIONSHIP.index('rating')
+FEATURES_END = len(CSV_INDEX_TO_RELATIONSHIP) - 1
+
+
+class Recipe:
+    '''A parsed recipe. The nutrition facts are a float64 vector indexed like
+    NUTRIENTS, nan for the nutrients the page does not list.
+    '''
+
+    __slots__ = (
+        'id',
+        'url',
+        'name',
+        'rating',
+        'reviews',
+        'made_it_count',
+        'ingredients',
+        'img_url',
+        'servings',
+        'prep_time',
+        'calories',
+        'nutrition',
+    )
+
+    separator = '|'  # used to separate ingredients
+
+    def __init__(self):
+        self.id = 0
+        self.url = ''
+        self.name = ''
+        self.rating = 0
+        self.reviews = 0
+        self.made_it_count = 0
+        self.ingredients = list()
+        self.img_url = ''
+        self.servings = 0
+        self.prep_time = 0
+        self.calories = 0  # calories/serving
+        self.nutrition = np.full(len(NUTRIENTS), np.nan)
+
+    def __str__(self):
+        return self.url
+
+    def __getstate__(self):
+        # Pickled as a tuple with the raw bytes of the nutrition vector, which
+        # is smaller than the pickle of the array
+        return tuple(getattr(self, name) for name in Recipe.__slots__[:-1]) + (self.nutrition.tobytes(),)
+
+    def __setstate__(self, state):
+        for name, value in zip(Recipe.__slots__[:-1], state):
+            setattr(self, name, value)
+        self.nutrition = np.frombuffer(state[-1], dtype=np.float64).copy()
+
+    def set_nutrient(self, name, quantity):
+        '''Set the quantity of a nutrient, ignoring the ones not in NUTRIENTS
+        '''
+        i = NUTRIENT_INDEX.get(name)
+        if i is not None:
+            self.nutrition[i] = quantity
+
+    def missing_nutrients(self):
+        return [name for name, quantity in zip(NUTRIENTS, self.nutrition.tolist()) if math.isnan(quantity)]
+
+    @property
+    def nutrition_facts(self):
+        '''The nutrition facts of the recipe by nutrient name
+        '''
+        return {
+            name: quantity
+            for name, quantity in zip(NUTRIENTS, self.nutrition.tolist())
+            if not math.isnan(quantity)
+        }
+
+    def to_row(self):
+        '''Return the csv row of the recipe, with its numbers as numbers
+        '''
+        row = [
+            self.id,
+            self.url,
+            self.name,
+            self.img_url,
+            self.servings,
+            self.prep_time,
+            self.rating,
+            self.reviews,
+            self.made_it_count,
+            self.calories,
+        ]
+        row += self.nutrition.tolist()
+        row += self.ingredients
+        return row
+
+    def features(self, out=None):
+        '''Return the nutriscore features of the recipe, the columns
+        FEATURES_START to FEATURES_END of its row, as a float64 vector
+        '''
+        if out is None:
+            out = np.empty(FEATURES_END - FEATURES_START)
+        out[:NUTRITION_START - FEATURES_START] = (self.rating, self.reviews, self.made_it_count, self.calories)
+        out[NUTRITION_START - FEATURES_START:] = self.nutrition[:FEATURES_END - NUTRITION_START]
+        return out
+
+
+def features_matrix(recipes):
+    '''Return the nutriscore features of a list of recipes as a float64
+    matrix, as RecipeStore.features returns them
+    '''
+    features = np.empty((len(recipes), FEATURES_END - FEATURES_START))
+    for recipe, out in zip(recipes, features):
+        recipe.features(out)
+    return features
+
+
+def csv_values(row):
+    '''Return a row of Recipe.to_row as the strings csv.writer writes and
+    DatabaseBuilder reads
+    '''
+    return ['' if value is None else str(value) for value in row]
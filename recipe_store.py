@@ -0,0 +1,178 @@
+import math
+import mmap
+import struct
+import zipfile
+import numpy as np
+from recipe_schema import CSV_INDEX_TO_RELATIONSHIP, FEATURES_START, FEATURES_END
+
+# Columns of a csv row stored as text, after the id
+TEXT_COLUMNS = CSV_INDEX_TO_RELATIONSHIP[1:4]
+
+# Columns of a csv row stored as numbers, the rest of the relationships
+NUMERIC_COLUMNS = CSV_INDEX_TO_RELATIONSHIP[4:]
+
+# Numeric columns that parser.py writes as integers
+INTEGER_COLUMNS = {
+    'servings',
+    'prep_time',
+    'reviews',
+    'made_it_count',
+    'calories',
+}
+
+
+def encode_strings(strings):
+    '''Return the utf-8 bytes of a list of strings concatenated, and the
+    offsets of each string in them
+    '''
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def decode_strings(offsets, values, start=0, end=None):
+    '''Return the strings start to end of the offsets and bytes of
+    encode_strings, decoding only their bytes
+    '''
+    if end is None:
+        end = len(offsets) - 1
+    offsets = offsets[start:end + 1].tolist()
+    data = values[offsets[0]:offsets[-1]].tobytes() if offsets else b''
+    return [data[a - offsets[0]:b - offsets[0]].decode('utf-8') for a, b in zip(offsets, offsets[1:])]
+
+
+# Size of the fixed part of the local header of a zip member, which ends with
+# the lengths of its file name and extra field
+ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def map_npz(path):
+    '''Return the arrays of an .npz file written by np.savez as read-only
+    arrays over a memory map of the file, so they are read from disk as they
+    are used instead of when the file is loaded
+    '''
+    arrays = dict()
+    with open(path, 'rb') as f, zipfile.ZipFile(f) as archive:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('{} is compressed and cannot be memory-mapped'.format(path))
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', f.read(ZIP_LOCAL_HEADER_SIZE)[-4:])
+            f.seek(info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            count = int(np.prod(shape))
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=f.tell())
+            arrays[info.filename[:-len('.npy')]] = array.reshape(shape, order='F' if fortran_order else 'C')
+    return arrays
+
+
+def _to_number(value):
+    if value is None or value == '':
+        return math.nan
+    return float(value)
+
+
+def _to_string(column, value):
+    if math.isnan(value):
+        return ''
+    if column in INTEGER_COLUMNS:
+        return str(int(value))
+    return str(value)
+
+
+class RecipeStore:
+    '''The recipes of htmls.csv in columns: the numeric columns as a float64
+    matrix, which nutriscore uses without converting strings, and the text
+    columns and ingredients as utf-8 bytes and offsets, decoded a row at a
+    time. Saved as an uncompressed .npz file, which is memory-mapped when
+    loaded.
+    '''
+
+    def __init__(self, ids, texts, numbers, ingredient_offsets, ingredients):
+        self.ids = ids
+        self.texts = texts  # column name to offsets and bytes
+        self.numbers = numbers
+        self.ingredient_offsets = ingredient_offsets
+        self.ingredients = ingredients  # offsets and bytes
+
+    @staticmethod
+    def from_rows(rows):
+        '''Create a store from csv rows, whose values are strings or numbers
+        '''
+        rows = list(rows)
+        num_columns = len(CSV_INDEX_TO_RELATIONSHIP)
+
+        ids = np.array([int(row[0]) for row in rows], dtype=np.int64)
+        texts = {
+            column: encode_strings(['' if row[i] is None else str(row[i]) for row in rows])
+            for i, column in enumerate(TEXT_COLUMNS, 1)
+        }
+        numbers = np.array(
+            [[_to_number(value) for value in row[len(TEXT_COLUMNS) + 1:num_columns]] for row in rows],
+            dtype=np.float64,
+        ).reshape(len(rows), len(NUMERIC_COLUMNS))
+
+        ingredient_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(row) - num_columns for row in rows], out=ingredient_offsets[1:])
+        ingredients = encode_strings([str(ingredient) for row in rows for ingredient in row[num_columns:]])
+
+        return RecipeStore(ids, texts, numbers, ingredient_offsets, ingredients)
+
+    @staticmethod
+    def load(path):
+        data = map_npz(path)
+        return RecipeStore(
+            data['id'],
+            {column: (data[column + '_offsets'], data[column]) for column in TEXT_COLUMNS},
+            data['numbers'],
+            data['ingredient_offsets'],
+            (data['ingredient_text_offsets'], data['ingredient_text']),
+        )
+
+    def save(self, path):
+        arrays = dict(
+            id=self.ids,
+            numbers=self.numbers,
+            ingredient_offsets=self.ingredient_offsets,
+        )
+        for column in TEXT_COLUMNS:
+            arrays[column + '_offsets'], arrays[column] = self.texts[column]
+        arrays['ingredient_text_offsets'], arrays['ingredient_text'] = self.ingredients
+
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, name):
+        '''Return a numeric column as a float64 array, without copying it
+        '''
+        return self.numbers[:, NUMERIC_COLUMNS.index(name)]
+
+    def features(self, start=0, end=None):
+        '''Return the nutriscore features of the recipes start to end, the
+        columns compute_input_batch converts from csv rows, without copying
+        them
+        '''
+        offset = len(TEXT_COLUMNS) + 1
+        return self.numbers[start:end, FEATURES_START - offset:FEATURES_END - offset]
+
+    def row(self, i):
+        '''Return the csv row of recipe i, as parser.py writes it
+        '''
+        row = [str(self.ids[i])]
+        row += [decode_strings(*self.texts[column], i, i + 1)[0] for column in TEXT_COLUMNS]
+        row += [_to_string(column, value) for column, value in zip(NUMERIC_COLUMNS, self.numbers[i].tolist())]
+        row += decode_strings(*self.ingredients, self.ingredient_offsets[i], self.ingredient_offsets[i + 1])
+        return row
+
+    def rows(self):
+        for i in range(len(self)):
+            yield self.row(i)
@@ -0,0 +1,229 @@
+# Generates recipes shaped like the allrecipes pages, for benchmarks
+
+import sys
+sys.path.append('ingredient_parser/')
+import argparse
+import html
+import os
+import random
+import re
+from load_ingredients import load_ingredients
+import recipe_schema
+
+# Units of the nutrients of the nutrition facts of a page
+NUTRIENT_UNITS = {
+    'total_fat': 'g',
+    'saturated_fat': 'g',
+    'cholesterol': 'mg',
+    'sodium': 'mg',
+    'potassium': 'mg',
+    'total_carbohydrates': 'g',
+    'dietary_fiber': 'g',
+    'protein': 'g',
+    'sugars': 'g',
+    'vitamin_a': 'IU',
+    'vitamin_c': 'mg',
+    'calcium': 'mg',
+    'iron': 'mg',
+    'thiamin': 'mg',
+    'niacin': 'mg',
+    'vitamin_b6': 'mg',
+    'magnesium': 'mg',
+    'folate': 'mcg',
+}
+
+# Names and units of the nutrients as a page shows them, in the order of the
+# csv rows. parser.py turns the names back into the column names.
+NUTRIENTS = [(name.replace('_', ' ').title(), NUTRIENT_UNITS[name]) for name in recipe_schema.NUTRIENTS]
+
+QUANTITIES = ['1', '2', '3', '1/2', '1/4', '3/4', '1 1/2', '2 1/2']
+UNITS = ['cup', 'cups', 'tablespoon', 'tablespoons', 'teaspoon', 'pound', 'ounces', '(8 ounce) package', '']
+PREPARATIONS = ['', '', ', chopped', ', melted', ', beaten', ', divided', ' in shell, peeled', ', or to taste']
+TITLE_WORDS = ['Easy', 'Grandma\'s', 'Spicy', 'Baked', '"Crab"', 'Classic', 'Quick', 'Stew', 'Cakes', 'Salad', 'Pie']
+
+PAGE = '''<!DOCTYPE html>
+<html lang="en-us">
+<head>
+    <meta charset="utf-8">
+    <title>{title} Recipe - Allrecipes.com</title>
+    <link id="canonicalUrl" rel="canonical" href="{url}">
+    <meta id="metaRecipeServings" itemprop="recipeYield" content="{servings}">
+</head>
+<body>
+    <section class="ar_recipe_index full-page" itemscope itemtype="http://schema.org/Recipe">
+        <div class="recipe-summary clearfix">
+            <h1 id="recipe-main-content" class="recipe-summary__h1" itemprop="name">{title}</h1>
+            <div class="recipe-summary__stars">
+                <img class="rating-stars-img" src="https://images.media-allrecipes.com/ar/stars.png" alt="Rated as {rating} out of 5 Stars">
+            </div>
+            <div class="summary-stats-box">
+                <a class="read--reviews"><span class="review-count">{reviews} reviews</span></a>
+                <span class="made-it-count"></span><!-- made it --><span>{made_it_count} made it</span>
+            </div>
+        </div>
+        <img class="rec-photo" src="{img_url}" alt="{title}">
+        <section class="recipe-ingredients">
+            <ul class="checklist dropdownwrapper list-ingredients-1">
+{ingredients}
+            </ul>
+        </section>
+        <section class="recipe-directions">
+            <ul class="prepTime"><li class="prepTime__item"><span class="ready-in-time">{prep_time}</span></li></ul>
+{directions}
+        </section>
+        <section class="recipe-footnotes">
+            <div class="nutrition-summary-facts">
+                <span itemprop="calories">{calories} calories</span>;
+            </div>
+{nutrition_rows}
+        </section>
+    </section>
+</body>
+</html>
+'''
+
+INGREDIENT = '                <li class="checkList__line"><label><input type="checkbox"/><span class="recipe-ingred_txt added" itemprop="recipeIngredient">{}</span></label></li>'
+
+NUTRITION_ROW = '''            <div class="nutrition-row">
+                <span class="nutrient-name" aria-label="{0}: {1}{2}">{0}: <span class="nutrient-value">{1}{2}</span></span>
+                <span class="daily-value">12%</span>
+            </div>'''
+
+# Number of direction steps, which only make the pages as large as real ones
+DIRECTION_STEPS = 8
+
+
+class SyntheticCorpus:
+    '''Generates random recipes as html pages, which parser.py parses into
+    the same rows as csv_row returns, and as csv rows directly. The same seed
+    generates the same recipes.
+    '''
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        _, alias_map = load_ingredients()
+        self.ingredient_names = sorted(alias_map)
+
+    def random(self, recipe_id):
+        return random.Random('{}:{}'.format(self.seed, recipe_id))
+
+    def ingredient_line(self, rnd):
+        return ' '.join(filter(None, [
+            rnd.choice(QUANTITIES),
+            rnd.choice(UNITS),
+            rnd.choice(self.ingredient_names),
+        ])) + rnd.choice(PREPARATIONS)
+
+    def ingredient_lines(self, n, seed=0):
+        rnd = random.Random('{}:lines:{}'.format(self.seed, seed))
+        return [self.ingredient_line(rnd) for _ in range(n)]
+
+    def recipe(self, recipe_id):
+        '''Return the values of recipe_id as they are displayed in its page
+        '''
+        rnd = self.random(recipe_id)
+        title = ' '.join(rnd.sample(TITLE_WORDS, rnd.randint(2, 4)))
+        hours, minutes = rnd.choice([0, 0, 1, 2]), rnd.randint(1, 59)
+        return dict(
+            id=recipe_id,
+            title=title,
+            url='https://www.allrecipes.com/recipe/{}/{}/'.format(recipe_id, re.sub(r'[^a-z]+', '-', title.lower()).strip('-')),
+            img_url='https://images.media-allrecipes.com/userphotos/560x315/{}.jpg'.format(rnd.randint(1, 10 ** 7)),
+            servings=rnd.randint(1, 12),
+            prep_time='{} h {} m'.format(hours, minutes) if hours else '{} m'.format(minutes),
+            prep_minutes=hours * 60 + minutes,
+            rating='{:.2f}'.format(rnd.uniform(1, 5)).rstrip('0').rstrip('.'),
+            reviews=rnd.randint(1, 999),
+            made_it_count=rnd.randint(1, 999),
+            calories=rnd.randint(20, 1200),
+            nutrients=[
+                '{:.1f}'.format(rnd.uniform(0, 60)) if unit == 'g' else str(rnd.randint(0, 900))
+                for _, unit in NUTRIENTS
+            ],
+            ingredients=[self.ingredient_line(rnd) for _ in range(rnd.randint(3, 14))],
+        )
+
+    def html(self, recipe_id):
+        recipe = self.recipe(recipe_id)
+        return PAGE.format(
+            title=html.escape(recipe['title']),
+            url=recipe['url'],
+            img_url=recipe['img_url'],
+            servings=recipe['servings'],
+            rating=recipe['rating'],
+            reviews=recipe['reviews'],
+            made_it_count=recipe['made_it_count'],
+            prep_time=recipe['prep_time'],
+            calories=recipe['calories'],
+            ingredients='\n'.join(INGREDIENT.format(html.escape(line)) for line in recipe['ingredients']),
+            directions='\n'.join(
+                '            <p class="step">Step {} of {}.</p>'.format(i, html.escape(recipe['title']))
+                for i in range(DIRECTION_STEPS)
+            ),
+            nutrition_rows='\n'.join(
+                NUTRITION_ROW.format(name, value, unit)
+                for (name, unit), value in zip(NUTRIENTS, recipe['nutrients'])
+            ),
+        )
+
+    def csv_row(self, recipe_id):
+        '''Return the csv row parser.py writes for the page of recipe_id, as
+        strings
+        '''
+        recipe = self.recipe(recipe_id)
+        row = [
+            recipe['id'],
+            recipe['url'],
+            recipe['title'],
+            recipe['img_url'],
+            recipe['servings'],
+            recipe['prep_minutes'],
+            float(recipe['rating']),
+            recipe['reviews'],
+            recipe['made_it_count'],
+            recipe['calories'],
+        ]
+        row += [float(value) for value in recipe['nutrients']]
+        return [str(value) for value in row] + recipe['ingredients']
+
+    def csv_rows(self, n, start=1):
+        for recipe_id in range(start, start + n):
+            yield self.csv_row(recipe_id)
+
+    def write_htmls(self, path, n, start=1):
+        '''Write the pages of n recipes under path, named like the downloaded
+        htmls
+        '''
+        os.makedirs(path, exist_ok=True)
+        for recipe_id in range(start, start + n):
+            with open(os.path.join(path, '{}.html'.format(recipe_id)), 'w') as f:
+                f.write(self.html(recipe_id))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Script that generates a folder of synthetic recipe htmls')
+    parser.add_argument(
+        'path',
+        help='path to the output folder',
+        type=str,
+    )
+    parser.add_argument(
+        '-n',
+        '--number',
+        dest='number',
+        help='number of recipes',
+        default=10000,
+        type=int,
+    )
+    parser.add_argument(
+        '-s',
+        '--seed',
+        dest='seed',
+        help='seed of the generated recipes',
+        default=0,
+        type=int,
+    )
+    args = parser.parse_args()
+
+    SyntheticCorpus(args.seed).write_htmls(args.path, args.number)
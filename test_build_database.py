@@ -1,12 +1,70 @@
 import sys
 import pytest
 from build_database import DatabaseBuilder
-from unittest.mock import Mock
+from ingredient_parser import IngredientParser
+from match_cache import MatchCache
+from rdf_writer import RdfWriter, ShardedFile
+from recipe_store import RecipeStore
+from recipe_ids import SeenIdSet
+from formatters import JsonFormatter
+from nutriscore import load_model, predict_nutriscore, predict_nutriscore_batch, LinearModel
+from unittest.mock import Mock, patch
 import csv
+import gzip
+import io
+import json
+import os
+import numpy as np
+import re
 
 TEST_QUOTATION_MARK_CSV = 'build_database_test_files/test_quotation_mark.csv'
 TEST_REDIRECTING = 'build_database_test_files/test_redirecting.csv'
 
+# Ten synthetic recipes and two parsed from parser_test_files. Recipe 5 has an
+# ingredient matching nothing and recipe 7 no macronutrients, so no score
+TEST_RECIPES_CSV = 'build_database_test_files/test_recipes.csv'
+TEST_RECIPE_IDS = [str(recipe_id) for recipe_id in range(1, 11)] + ['13938', '21014']
+
+RDF_TRIPLE = re.compile(r'^_:(\S+) <(\S+)> (?:"(.*)"|_:(\S+)) \.$')
+
+
+def rdf_triples(content):
+    triples = set()
+    for line in content.splitlines():
+        subject, predicate, value, node = RDF_TRIPLE.match(line).groups()
+        if node is None:
+            triples.add((subject, predicate, JsonFormatter.typed(predicate, value.replace(r'\"', r'"'))))
+        else:
+            triples.add((subject, predicate, ('uid', node)))
+    return triples
+
+
+def json_triples(content):
+    triples = set()
+    for line in content.splitlines():
+        node = json.loads(line)
+        subject = node.pop('uid')[len('_:'):]
+        for predicate, values in node.items():
+            for value in (values if isinstance(values, list) else [values]):
+                if isinstance(value, dict):
+                    value = ('uid', value['uid'][len('_:'):])
+                triples.add((subject, predicate, value))
+    return triples
+
+
+def count_test_recipes_ingredients():
+    """
+    Return the number of ingredients of TEST_RECIPES_CSV the builder parses,
+    which leaves out the ignored ones and those of recipe 7, without a score.
+    """
+    with open(TEST_RECIPES_CSV, 'r') as f_input:
+        return sum(
+            1
+            for row in csv.reader(f_input) if row[0] != '7'
+            for raw_ingredient in row[len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP):]
+            if DatabaseBuilder.IGNORED_INGREDIENTS.search(raw_ingredient) is None
+        )
+
 
 class MockFileObject:
     pass
@@ -26,10 +84,26 @@ class TestClass:
         for call in f_output.write.call_args_list:
             args, kwargs = call
             assert len(args) == 1
-            line = args[0]
-            # Remove escaped quotation marks
-            line = line.replace(r'\"', r'')
-            assert (line.count(r'"') == 0 or line.count(r'"') == 2)
+            for line in args[0].splitlines():
+                # Remove escaped quotation marks
+                line = line.replace(r'\"', r'')
+                assert (line.count(r'"') == 0 or line.count(r'"') == 2)
+
+    def test_escaped_ingredients(self):
+
+        with open(TEST_QUOTATION_MARK_CSV, 'r') as f_input:
+            row = next(csv.reader(f_input))
+        row.append('1 cup "lump" crab meat')
+
+        # Ingredients are parsed with their quotation marks escaped, as the
+        # original builder escaped every column of the csv rows first
+        builder = DatabaseBuilder(None, io.StringIO(), 'nutriscore.model')
+        with patch.object(builder.ingredient_parser, 'parse_many',
+                          side_effect=builder.ingredient_parser.parse_many) as parse_many:
+            builder.build_rows([row], build_ingredients=False)
+        raw_ingredients = parse_many.call_args[0][0]
+        assert raw_ingredients[-1] == r'1 cup \"lump\" crab meat'
+        assert all('"' not in raw_ingredient.replace(r'\"', '') for raw_ingredient in raw_ingredients)
 
     def test_redirecting(self):
 
@@ -43,3 +117,303 @@ class TestClass:
         # DatabaseBuilder should skip when redirection is detected (i.e. a
         # mismatching id and url from the csv)
         f_output.write.assert_not_called()
+
+    def test_match_cache(self, tmp_path):
+
+        match_cache = str(tmp_path / 'match_cache.sqlite')
+
+        outputs = []
+        calls = []
+        for _ in range(2):
+            f_output = io.StringIO()
+            with open(TEST_QUOTATION_MARK_CSV, 'r') as f_input, \
+                    patch.object(IngredientParser, '_find_closest_match', autospec=True,
+                                 side_effect=IngredientParser._find_closest_match) as find_closest_match:
+                builder = DatabaseBuilder(f_input, f_output, 'nutriscore.model', match_cache=match_cache)
+                builder.build(build_ingredients=False)
+            outputs.append(f_output.getvalue())
+            calls.append(find_closest_match.call_count)
+
+        # The second build should reuse the matches of the first one instead
+        # of matching any expression again
+        assert len(MatchCache(match_cache).load()) > 0
+        assert calls[0] > 0 and calls[1] == 0
+        assert outputs[0] == outputs[1]
+
+        # The matches found by the workers are written by the parent process,
+        # including the expressions matching nothing
+        match_cache = str(tmp_path / 'workers.sqlite')
+        with open(TEST_RECIPES_CSV, 'r') as f_input:
+            builder = DatabaseBuilder(f_input, io.StringIO(), 'nutriscore.model', match_cache=match_cache,
+                                      recipes_per_batch=2, workers=3)
+            builder.build(build_ingredients=False)
+        assert not builder.match_cache.new_matches
+        matches = MatchCache(match_cache).load()
+        assert len(matches) == builder.cache_info()['match'].misses
+        unmatched = matches._connect().execute('SELECT expression FROM matches WHERE ingredient IS NULL').fetchall()
+        assert len(unmatched) == 1 and 'qqqq' in unmatched[0][0]
+        assert unmatched[0][0] in matches and matches[unmatched[0][0]] is None
+        assert matches.get('unknown expression', 'missing') == 'missing'
+        with open(TEST_RECIPES_CSV, 'r') as f_input, \
+                patch.object(IngredientParser, '_find_closest_match', autospec=True,
+                             side_effect=IngredientParser._find_closest_match) as find_closest_match:
+            DatabaseBuilder(f_input, io.StringIO(), 'nutriscore.model', match_cache=match_cache).build()
+        assert find_closest_match.call_count == 0
+
+    def test_match_cache_invalidation(self, tmp_path):
+
+        ing_dir = tmp_path / 'ingredients'
+        ing_dir.mkdir()
+        (ing_dir / 'dairy').write_text('butter\n')
+        path = str(tmp_path / 'match_cache.sqlite')
+
+        match_cache = MatchCache(path, str(ing_dir)).load()
+        match_cache['butter'] = 'butter'
+        match_cache.flush()
+        assert 'butter' in MatchCache(path, str(ing_dir)).load()
+
+        # Changing a threshold should empty the cache
+        assert len(MatchCache(path, str(ing_dir), matching_threshold=30).load()) == 0
+        match_cache = MatchCache(path, str(ing_dir)).load()
+        match_cache['butter'] = 'butter'
+        match_cache.flush()
+
+        # and so should editing the catalog
+        (ing_dir / 'dairy').write_text('butter\nmilk\n')
+        assert len(MatchCache(path, str(ing_dir)).load()) == 0
+
+    def test_workers(self):
+
+        outputs = []
+        builders = []
+        for workers in [1, 3]:
+            f_output = io.StringIO()
+            with open(TEST_RECIPES_CSV, 'r') as f_input:
+                builder = DatabaseBuilder(f_input, f_output, 'nutriscore.model', recipes_per_batch=2, workers=workers)
+                builder.build()
+            outputs.append(f_output.getvalue())
+            builders.append(builder)
+
+        # A parallel build should write exactly what a serial build writes,
+        # with the batches of the workers in the order of the csv file
+        assert outputs[0] == outputs[1]
+        ids = [line.split()[0] for line in outputs[1].splitlines() if ' <rating> ' in line]
+        assert ids == ['_:{}'.format(recipe_id) for recipe_id in TEST_RECIPE_IDS if recipe_id != '7']
+
+        # and count the same recipes and parsed ingredients
+        num_ingredients = count_test_recipes_ingredients()
+        for builder in builders:
+            assert builder.num_recipes_processed == len(TEST_RECIPE_IDS)
+            assert builder.num_recipes_failed == builders[0].num_recipes_failed
+            info = builder.cache_info()['parse']
+            assert info.hits + info.misses == num_ingredients
+            assert builder.stage_metrics().report()['recipe']['count'] == len(TEST_RECIPE_IDS)
+        assert builders[0].num_recipes_failed >= 1
+        assert len(builders[1].worker_cache_info) > 1
+
+    def test_seen(self, tmp_path):
+
+        with open(TEST_RECIPES_CSV, 'r') as f_input:
+            rows = list(csv.reader(f_input))
+
+        expected = io.StringIO()
+        DatabaseBuilder(None, expected, 'nutriscore.model').build_rows(rows, build_ingredients=False)
+
+        # Recipes appended again to the csv file should be built once, and a
+        # page redirected to another recipe not at all
+        redirected = list(rows[0])
+        redirected[0] = '99'
+        duplicated = rows[:5] + [rows[2], redirected] + rows[5:] + [rows[11], rows[0]]
+        for workers in [1, 3]:
+            f_output = io.StringIO()
+            builder = DatabaseBuilder(None, f_output, 'nutriscore.model', recipes_per_batch=2, workers=workers)
+            builder.build_rows(duplicated, build_ingredients=False)
+            assert f_output.getvalue() == expected.getvalue()
+            assert builder.num_recipes_processed == len(rows)
+            assert builder.num_recipes_skipped == 4
+            assert builder.report()['skipped'] == 4
+
+        # and not built again by a build loading the saved seen-id set, except
+        # the recipes that failed: 5, with an ingredient matching nothing, and
+        # 7, without a score
+        path = str(tmp_path / 'seen.bin')
+        builder.seen.save(path)
+        seen = SeenIdSet.load(path)
+        assert len(seen) == len(rows) - 2 and '99' not in seen
+        assert [recipe_id for recipe_id in TEST_RECIPE_IDS if recipe_id not in seen] == ['5', '7']
+
+        # which are built again, e.g. once the catalog matches the ingredient
+        fixed = [[value for value in row if 'qqqq' not in value] for row in duplicated]
+        f_output = io.StringIO()
+        builder = DatabaseBuilder(None, f_output, 'nutriscore.model', seen=seen)
+        builder.build_rows(fixed, build_ingredients=False)
+        assert builder.num_recipes_processed == 2
+        assert builder.num_recipes_skipped == len(duplicated) - 2
+        assert [line.split()[0] for line in f_output.getvalue().splitlines() if ' <rating> ' in line] == ['_:5']
+        assert '5' in builder.seen and '7' not in builder.seen
+
+        # A build skipping every recipe builds nothing
+        builder.seen.add('7')
+        f_output = io.StringIO()
+        builder = DatabaseBuilder(None, f_output, 'nutriscore.model', seen=builder.seen)
+        builder.build_rows(duplicated, build_ingredients=False)
+        assert f_output.getvalue() == ''
+        assert builder.num_recipes_skipped == len(duplicated)
+        assert builder.num_recipes_processed == 0
+        builder.statistics()
+
+        # A row without a numeric id is built, but not deduplicated
+        odd_row = list(rows[11])
+        odd_row[0] = 'draft'
+        odd_row[1] = odd_row[1].replace('/21014/', '/draft/')
+        f_output = io.StringIO()
+        builder = DatabaseBuilder(None, f_output, 'nutriscore.model', seen=builder.seen)
+        builder.build_rows([odd_row, odd_row], build_ingredients=False)
+        assert builder.num_recipes_processed == 2 and builder.num_recipes_skipped == 0
+        assert f_output.getvalue().count('_:draft <rating> ') == 2
+        assert 'draft' not in builder.seen
+
+    def test_nutriscore_batch(self):
+
+        model = load_model('nutriscore.model')
+        with open(TEST_QUOTATION_MARK_CSV, 'r') as f_input:
+            rows = [row[:len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP) - 1] for row in csv.reader(f_input)]
+
+        # A recipe without protein, fat and carbohydrates has no score
+        zero_row = list(rows[0])
+        for relationship in ['protein', 'total_fat', 'total_carbohydrates']:
+            zero_row[DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP.index(relationship)] = '0'
+
+        scores, zero_division = predict_nutriscore_batch(model, rows + [zero_row])
+        assert list(zero_division) == [False] * len(rows) + [True]
+        for row, score in zip(rows, scores):
+            assert score == pytest.approx(predict_nutriscore(model, row))
+
+    def test_npz_model(self, tmp_path):
+
+        model = load_model('nutriscore.model')
+        npz_model = str(tmp_path / 'nutriscore.npz')
+        LinearModel.from_model(model).save(npz_model)
+
+        with open(TEST_QUOTATION_MARK_CSV, 'r') as f_input:
+            rows = [row[:len(DatabaseBuilder.CSV_INDEX_TO_RELATIONSHIP) - 1] for row in csv.reader(f_input)]
+
+        # The converted models should predict the same scores as the pickled one
+        for filename in [npz_model, 'nutriscore.npz']:
+            converted = load_model(filename)
+            assert isinstance(converted, LinearModel)
+            for row in rows:
+                assert predict_nutriscore(converted, row) == pytest.approx(predict_nutriscore(model, row))
+
+    def test_rdf_writer(self, tmp_path):
+
+        f_output = io.StringIO()
+        with open(TEST_QUOTATION_MARK_CSV, 'r') as f_input:
+            builder = DatabaseBuilder(f_input, f_output, 'nutriscore.model')
+            builder.build()
+        expected = f_output.getvalue()
+
+        # Small buffers and shards so the output is spread over several files
+        sharded_file = ShardedFile(str(tmp_path / 'recipedia.rdf.gz'), shard_size=4096)
+        with open(TEST_QUOTATION_MARK_CSV, 'r') as f_input, RdfWriter(sharded_file, buffer_size=1024) as f_output:
+            builder = DatabaseBuilder(f_input, f_output, 'nutriscore.model')
+            builder.build()
+
+        assert len(sharded_file.paths) > 1
+        assert sharded_file.paths[0] == str(tmp_path / 'recipedia-0000.rdf.gz')
+        content = ''
+        for path in sharded_file.paths:
+            with gzip.open(path, 'rt') as f:
+                content += f.read()
+        assert content == expected
+
+        # The shards are about shard_size bytes once compressed
+        sharded_file = ShardedFile(str(tmp_path / 'numbers.rdf.gz'), shard_size=4096)
+        for i in range(2000):
+            sharded_file.write('_:{} <calories> "{}" .\n'.format(i, i * 7919 % 10007))
+        sharded_file.close()
+        assert len(sharded_file.paths) > 1
+        assert all(4096 <= os.path.getsize(path) < 4096 + 100 for path in sharded_file.paths[:-1])
+
+        # and so are those of non-ASCII output, counted in utf-8 bytes
+        sharded_file = ShardedFile(str(tmp_path / 'recipedia.rdf'), shard_size=100)
+        for _ in range(20):
+            sharded_file.write('_:1 <name> "Crème brûlée" .\n' * 2)
+        sharded_file.close()
+        for path in sharded_file.paths[:-1]:
+            with open(path, 'rb') as f:
+                assert len(f.read()) == 2 * len('_:1 <name> "Crème brûlée" .\n'.encode('utf-8')) * 2
+
+    def test_json_format(self):
+
+        outputs = dict()
+        for output_format in ['rdf', 'json']:
+            f_output = io.StringIO()
+            with open(TEST_QUOTATION_MARK_CSV, 'r') as f_input:
+                builder = DatabaseBuilder(f_input, f_output, 'nutriscore.model', output_format=output_format)
+                builder.build()
+            outputs[output_format] = f_output.getvalue()
+
+        # Both formats should describe the same graph, with rounded scores
+        rdf = rdf_triples(outputs['rdf'])
+        assert len(rdf) > 0
+        assert json_triples(outputs['json']) == rdf
+
+    def test_recipe_store(self, tmp_path):
+
+        f_output = io.StringIO()
+        with open(TEST_RECIPES_CSV, 'r') as f_input:
+            rows = list(csv.reader(f_input))
+            f_input.seek(0)
+            DatabaseBuilder(f_input, f_output, 'nutriscore.model', recipes_per_batch=2).build()
+        expected = f_output.getvalue()
+
+        store_path = str(tmp_path / 'htmls.npz')
+        RecipeStore.from_rows(rows).save(store_path)
+        store = RecipeStore.load(store_path)
+        assert list(store.rows()) == rows
+        assert [store.row(i) for i in [11, 0, 6]] == [rows[11], rows[0], rows[6]]
+
+        # The columns are read-only views of the memory-mapped file
+        assert not store.numbers.flags.writeable
+        assert np.shares_memory(store.features(2, 4), store.numbers)
+        assert list(store.column('rating')) == [float(row[6]) for row in rows]
+
+        # and build the database the csv file builds, over several batches
+        for workers in [1, 3]:
+            f_output = io.StringIO()
+            DatabaseBuilder(None, f_output, 'nutriscore.model', workers=workers, recipes_per_batch=2).build_store(store)
+            assert f_output.getvalue() == expected
+
+    def test_metrics(self, tmp_path):
+
+        num_ingredients = count_test_recipes_ingredients()
+        for workers in [1, 3]:
+            with open(TEST_RECIPES_CSV, 'r') as f_input:
+                builder = DatabaseBuilder(f_input, io.StringIO(), 'nutriscore.model', recipes_per_batch=2, workers=workers)
+                builder.build()
+
+            # The stages of the workers should be merged into the report, and
+            # the stages of the parser count the hits of their caches too
+            report = builder.report()
+            assert report['recipes'] == len(TEST_RECIPE_IDS)
+            assert report['failed'] == builder.num_recipes_failed >= 1
+            assert report['skipped'] == 0
+            stages = report['stages']
+            assert stages['recipe']['count'] == len(TEST_RECIPE_IDS)
+            assert stages['nutriscore']['count'] == len(TEST_RECIPE_IDS)
+            assert stages['ingredients']['count'] == len(TEST_RECIPE_IDS) - 1
+            assert stages['parse']['count'] == num_ingredients
+            for stage in ['parse', 'parenthesis', 'singular', 'match', 'similarity']:
+                info = builder.cache_info()[stage]
+                assert stages[stage]['count'] == info.hits + info.misses
+                assert report['caches'][stage]['hits'] == info.hits
+            # Every string stripped of its parenthesis has its adpositions removed
+            assert stages['adpositions']['count'] == stages['parenthesis']['count']
+            for stats in stages.values():
+                assert 0 <= stats['p50'] <= stats['p95'] <= stats['p99']
+
+        path = str(tmp_path / 'metrics.json')
+        builder.write_metrics(path)
+        with open(path, 'r') as f:
+            assert json.load(f)['stages'].keys() == report['stages'].keys()
@@ -0,0 +1,210 @@
+import asyncio
+import collections
+import csv
+import http.server
+import re
+import socketserver
+import threading
+import time
+import pytest
+from fetcher import RecipeFetcher, TokenBucket, IdRanges, HtmlWriter, RowWriter, fetch_recipes, FETCHED, MISSING, \
+    NO_NUTRITION, FAILED
+from recipe_schema import csv_values
+import recipe_parser
+
+# Test htmls served by RecipeServer, by recipe id
+TEST_HTMLS = {
+    1: 'parser_test_files/13938.html',
+    2: 'parser_test_files/21014.html',
+    4: 'parser_test_files/24060.html',
+    5: 'parser_test_files/24059.html',
+    13938: 'parser_test_files/13938.html',
+}
+
+NUTRITION_ROW = re.compile(rb'<div class="nutrition-row">.*?</div>', re.DOTALL)
+
+
+def collapse_nutrition(recipe_id, page):
+    '''Return a test html as allrecipes.com serves it, with a nutrition button
+    in place of its nutrition rows, and the page the button links to. A html
+    without nutrition rows has no button.
+    '''
+    rows = NUTRITION_ROW.findall(page)
+    if not rows:
+        return page, None
+    button = '<a class="see-full-nutrition" href="/recipe/{}/fullrecipenutrition/">'.format(recipe_id).encode()
+    start = page.index(rows[0])
+    collapsed = page[:start] + button + NUTRITION_ROW.sub(b'', page[start:])
+    return collapsed, b'<html><body><div class="nutrition">' + b''.join(rows) + b'</div></body></html>'
+
+
+class RecipeServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    '''Stand-in for allrecipes.com serving the test htmls under /recipe/<id>
+    and their nutrition facts under /recipe/<id>/fullrecipenutrition/. The
+    first failures[id] requests of a recipe get a server error.
+    '''
+
+    def __init__(self, pages, failures=None):
+        super().__init__(('127.0.0.1', 0), RecipeHandler)
+        self.pages = dict()
+        self.nutrition = dict()
+        for recipe_id, page in pages.items():
+            self.pages[recipe_id], self.nutrition[recipe_id] = collapse_nutrition(recipe_id, page)
+        self.failures = collections.Counter(failures or {})
+        self.requests = collections.Counter()
+        self.nutrition_requests = collections.Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}/recipe/'.format(self.server_address[1])
+
+
+class RecipeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = self.path.strip('/').split('/')
+        recipe_id = int(parts[1])
+        if parts[2:] == ['fullrecipenutrition']:
+            with self.server.lock:
+                self.server.nutrition_requests[recipe_id] += 1
+            pages = self.server.nutrition
+            failed = False
+        else:
+            with self.server.lock:
+                self.server.requests[recipe_id] += 1
+                failed = self.server.failures[recipe_id] > 0
+                self.server.failures[recipe_id] -= 1
+            pages = self.server.pages
+
+        if failed:
+            self.send_response(503)
+            body = b''
+        elif pages.get(recipe_id) is not None:
+            self.send_response(200)
+            body = pages[recipe_id]
+        else:
+            self.send_response(404)
+            body = b''
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def pages():
+    pages = dict()
+    for recipe_id, path in TEST_HTMLS.items():
+        with open(path, 'rb') as f:
+            pages[recipe_id] = f.read()
+    return pages
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+class TestClass:
+
+    def test_fetch(self, tmp_path, pages):
+        server = serve(RecipeServer(pages, failures={2: 2}))
+        try:
+            progress = str(tmp_path / 'progress.json')
+            with RecipeFetcher(server.base_url, concurrency=4, rate=0, backoff=0) as fetcher:
+                assert fetch_recipes(fetcher, 1, 5, HtmlWriter(str(tmp_path / 'htmls')), progress)
+                assert fetcher.counts == {FETCHED: 3, MISSING: 1, NO_NUTRITION: 1, FAILED: 0}
+
+            # Every page should be saved with the full nutrition facts its
+            # button links to, after retrying the errors
+            for recipe_id in [1, 2, 4]:
+                html = (tmp_path / 'htmls' / '{}.html'.format(recipe_id)).read_bytes()
+                assert b'see-full-nutrition' in html
+                assert NUTRITION_ROW.findall(html) == NUTRITION_ROW.findall(pages[recipe_id])
+            # and a page without nutrition button skipped, like scraper.js
+            assert not (tmp_path / 'htmls' / '3.html').exists()
+            assert not (tmp_path / 'htmls' / '5.html').exists()
+            assert server.requests == {1: 1, 2: 3, 3: 1, 4: 1, 5: 1}
+            assert server.nutrition_requests == {1: 1, 2: 1, 4: 1}
+            assert IdRanges.load(progress).ranges() == [[1, 5]]
+
+            # The recipes done should not be fetched again
+            server.requests.clear()
+            with RecipeFetcher(server.base_url, rate=0, backoff=0) as fetcher:
+                assert fetch_recipes(fetcher, 1, 8, HtmlWriter(str(tmp_path / 'htmls')), progress)
+            assert server.requests == {6: 1, 7: 1, 8: 1}
+            assert IdRanges.load(progress).ranges() == [[1, 8]]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_sessions(self):
+        # requests.Session is not thread-safe, so each thread gets its own
+        with RecipeFetcher() as fetcher:
+            sessions = list(fetcher.executor.map(lambda _: fetcher._session(), range(1)))
+            sessions.append(fetcher._session())
+            assert fetcher._session() is sessions[1]
+            assert sessions[0] is not sessions[1]
+            assert fetcher.sessions == sessions
+
+    def test_consecutive_failures(self, tmp_path, pages):
+        server = serve(RecipeServer(pages, failures={recipe_id: 10 for recipe_id in range(100, 110)}))
+        try:
+            progress = str(tmp_path / 'progress.json')
+            with RecipeFetcher(server.base_url, concurrency=1, rate=0, backoff=0) as fetcher:
+                assert not fetch_recipes(fetcher, 98, 110, HtmlWriter(str(tmp_path / 'htmls')), progress)
+
+            # Like scraper.js, each recipe is tried 3 times and the fetcher
+            # stops after 3 recipes failed in a row
+            assert fetcher.counts == {FETCHED: 0, MISSING: 2, NO_NUTRITION: 0, FAILED: 3}
+            assert [server.requests[recipe_id] for recipe_id in range(98, 104)] == [1, 1, 3, 3, 3, 0]
+            assert IdRanges.load(progress).ranges() == [[98, 99]]
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_rows(self, tmp_path, pages, capsys):
+        server = serve(RecipeServer(pages))
+        try:
+            output = str(tmp_path / 'htmls.csv')
+            with RecipeFetcher(server.base_url, rate=0) as fetcher, open(output, 'w') as f_csv:
+                fetch_recipes(fetcher, 13938, 13938, RowWriter(f_csv, 'lxml'))
+                # Recipe 1 is served the page of 13938, as if it redirected
+                fetch_recipes(fetcher, 1, 1, RowWriter(f_csv, 'lxml'))
+            with open(output, 'r') as f:
+                rows = list(csv.reader(f))
+            assert [row[:3] for row in rows] == [
+                ['13938', 'https://www.allrecipes.com/recipe/13938/connies-zucchini-crab-cakes/', 'Connie\'s Zucchini "Crab" Cakes']]
+
+            # The nutrition facts fetched should parse like the expanded page
+            expected = recipe_parser.parse_recipe(13938, str(pages[13938], 'utf-8'), 'lxml')
+            assert rows == [csv_values(recipe_parser.recipe_to_row(expected))]
+            assert 'Redirected 1' in capsys.readouterr().out
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_id_ranges(self):
+        ranges = IdRanges([[1, 3], [10, 12]])
+        for recipe_id in [5, 4, 9, 20]:
+            ranges.add(recipe_id)
+        assert ranges.ranges() == [[1, 5], [9, 12], [20, 20]]
+        assert 4 in ranges and 6 not in ranges and 0 not in ranges
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+
+        async def acquire(n):
+            for _ in range(n):
+                await bucket.acquire()
+
+        loop = asyncio.new_event_loop()
+        start = time.monotonic()
+        loop.run_until_complete(acquire(21))
+        loop.close()
+        assert time.monotonic() - start >= 0.19
@@ -0,0 +1,218 @@
+import os
+import pickle
+import shutil
+import tarfile
+import zipfile
+import pytest
+import csv
+from unittest.mock import patch
+from html_sources import HtmlBundle, open_htmls
+from parse_manifest import ParseManifest
+from recipe_ids import SeenIdSet
+from recipe_schema import NUTRIENTS, NUTRITION_START, INGREDIENTS_START, FEATURES_START, FEATURES_END, features_matrix
+from recipe_store import RecipeStore
+from nutriscore import compute_input_batch
+from synthetic_corpus import SyntheticCorpus
+import recipe_parser as parser
+
+
+TEST_HTMLS = 'parser_test_files'
+TEST_HTML = 'parser_test_files/13938.html'
+TEST_NO_NUTRITION_HTML = 'parser_test_files/24059.html'
+# Page of recipe 13938 served for the id 24060
+TEST_REDIRECTED_HTML = 'parser_test_files/24060.html'
+
+
+class TestClass:
+
+    def test_parse_recipe_html(self):
+        recipe = parser.parse_recipe_html(TEST_HTML)
+        assert recipe.id == 13938
+        assert recipe.url == 'https://www.allrecipes.com/recipe/13938/connies-zucchini-crab-cakes/'
+        assert recipe.name == 'Connie\'s Zucchini "Crab" Cakes'
+        assert recipe.rating == 4.49
+        assert recipe.reviews == 312
+        assert recipe.made_it_count == 452
+        assert recipe.servings == 5
+        assert recipe.prep_time == 30
+        assert recipe.calories == 196
+        assert recipe.nutrition_facts['total_fat'] == 9.1
+        assert recipe.nutrition_facts['folate'] == 57.0
+        assert recipe.ingredients[0] == '2 1/2 cups grated zucchini'
+        assert len(recipe.ingredients) == 8
+
+    def test_recipe_record(self):
+        recipe = parser.parse_recipe_html(TEST_HTML)
+        row = parser.recipe_to_row(recipe)
+
+        # The nutrition facts are a vector in the order of the schema
+        assert not hasattr(recipe, '__dict__')
+        assert recipe.nutrition.dtype == 'float64'
+        assert row[:NUTRITION_START] == [recipe.id, recipe.url, recipe.name, recipe.img_url, recipe.servings,
+                                         recipe.prep_time, recipe.rating, recipe.reviews, recipe.made_it_count,
+                                         recipe.calories]
+        assert row[NUTRITION_START:INGREDIENTS_START] == [recipe.nutrition_facts[name] for name in NUTRIENTS]
+        assert row[INGREDIENTS_START:] == recipe.ingredients
+
+        # Records are pickled between processes without losing anything
+        assert parser.recipe_to_row(pickle.loads(pickle.dumps(recipe))) == row
+
+        # and the features of the records those of their rows
+        recipe_input, _ = compute_input_batch([row])
+        assert (features_matrix([recipe]) == recipe_input[:, :FEATURES_END - FEATURES_START]).all()
+
+    def test_no_nutrition_facts(self):
+        with pytest.raises(parser.NoNutritionFactsException):
+            parser.parse_recipe_html(TEST_NO_NUTRITION_HTML)
+
+    def test_redirected(self):
+        for backend in sorted(parser.BACKENDS):
+            with pytest.raises(parser.RedirectedRecipeException):
+                parser.parse_recipe_html(TEST_REDIRECTED_HTML, backend)
+
+        # The redirect is detected from the canonical url alone
+        with pytest.raises(parser.RedirectedRecipeException):
+            parser.parse_recipe(24060, '<link id="canonicalUrl" href="https://www.allrecipes.com/recipe/13938/connies-zucchini-crab-cakes/">')
+
+    def test_jobs(self):
+        f_htmls = parser.find_recipe_htmls(TEST_HTMLS)
+        results = [list(parser.parse_recipe_htmls(f_htmls, jobs)) for jobs in [1, 2]]
+
+        # Parsing in parallel should yield the same results in the same order
+        assert results[0] == results[1]
+        assert [outcome for _, outcome, _ in results[0]] == [
+            parser.OK, parser.OK, parser.NO_NUTRITION, parser.REDIRECTED, parser.FAILED]
+        ids = [row[0] for _, outcome, row in results[0] if outcome == parser.OK]
+        assert ids == sorted(ids)
+
+    def test_backend_parity(self):
+        for f_html in parser.find_recipe_htmls(TEST_HTMLS):
+            results = []
+            for backend in sorted(parser.BACKENDS):
+                try:
+                    results.append(parser.recipe_to_row(parser.parse_recipe_html(f_html, backend)))
+                except parser.NoNutritionFactsException:
+                    results.append(parser.NO_NUTRITION)
+                except Exception:
+                    results.append(parser.FAILED)
+
+            # Every backend should extract the same recipe
+            assert all(result == results[0] for result in results), os.path.basename(f_html)
+
+    def test_incremental(self, tmp_path):
+        path = str(tmp_path / 'htmls')
+        output = str(tmp_path / 'htmls.csv')
+        manifest = str(tmp_path / 'htmls.csv.manifest.json')
+        shutil.copytree(TEST_HTMLS, path)
+
+        assert parser.parse_to_csv(path, output, ParseManifest(manifest).load()) == (5, 2, 0)
+        with open(output, 'r') as f:
+            content = f.read()
+
+        # Nothing changed, so nothing should be parsed again
+        assert parser.parse_to_csv(path, output, ParseManifest(manifest).load()) == (0, 0, 5)
+        with open(output, 'r') as f:
+            assert f.read() == content
+
+        # Only the changed html should be parsed again, and its row replaced
+        with open(os.path.join(path, '21014.html'), 'a') as f:
+            f.write('\n')
+        assert parser.parse_to_csv(path, output, ParseManifest(manifest).load()) == (1, 1, 4)
+        with open(output, 'r') as f:
+            assert f.read() == content
+
+    def test_seen(self, tmp_path):
+        output = str(tmp_path / 'htmls.csv')
+        manifest = ParseManifest(output + '.manifest.json')
+        seen = SeenIdSet()
+        seen.add(13938)
+
+        # An old csv file may have rows without a numeric id, which are kept
+        # but not deduplicated
+        odd_row = ['draft', 'https://www.allrecipes.com/recipe/draft/untitled/', 'Untitled']
+        with open(output, 'w') as f:
+            csv.writer(f, delimiter=',', quoting=csv.QUOTE_ALL).writerows([odd_row, odd_row])
+
+        # The htmls of the recipes already built should not be parsed
+        assert parser.parse_to_csv(TEST_HTMLS, output, manifest, seen=seen) == (4, 1, 1)
+        with open(output, 'r') as f:
+            assert [row[0] for row in csv.reader(f)] == ['21014', 'draft', 'draft']
+        assert 'draft' not in seen
+
+    def test_recipe_store(self, tmp_path):
+        output = str(tmp_path / 'htmls.csv')
+        store_output = str(tmp_path / 'htmls.npz')
+        assert parser.parse_to_csv(TEST_HTMLS, output, ParseManifest(output + '.manifest.json')) == (5, 2, 0)
+        assert parser.parse_to_csv(TEST_HTMLS, store_output, ParseManifest(store_output + '.manifest.json')) == (5, 2, 0)
+
+        # The store should hold the rows of the csv file, with typed numbers
+        with open(output, 'r') as f:
+            rows = list(csv.reader(f))
+        store = RecipeStore.load(store_output)
+        assert list(store.rows()) == rows
+        assert store.column('rating').dtype == 'float64'
+        assert list(store.column('reviews')) == [float(row[7]) for row in rows]
+
+        # Updating the store should keep the unchanged recipes
+        with open(os.path.join(TEST_HTMLS, '21014.html'), 'r') as f:
+            html = f.read()
+        path = str(tmp_path / 'htmls')
+        os.mkdir(path)
+        with open(os.path.join(path, '21014.html'), 'w') as f:
+            f.write(html)
+        assert parser.parse_to_csv(path, store_output, ParseManifest(store_output + '.manifest.json').load()) == (1, 1, 0)
+        assert list(RecipeStore.load(store_output).rows()) == rows
+
+    def test_synthetic_corpus(self, tmp_path):
+        corpus = SyntheticCorpus(seed=1)
+        corpus.write_htmls(str(tmp_path), 20)
+
+        # The generated pages should parse into the generated rows
+        for backend in sorted(parser.BACKENDS):
+            for f_html, outcome, row in parser.parse_recipe_htmls(parser.find_recipe_htmls(str(tmp_path)), backend=backend):
+                assert outcome == parser.OK
+                assert [str(value) for value in row] == corpus.csv_row(parser.recipe_id_from_path(f_html))
+
+    def test_html_sources(self, tmp_path):
+        output = str(tmp_path / 'htmls.csv')
+        parser.parse_to_csv(TEST_HTMLS, output, ParseManifest(output + '.manifest.json'))
+        with open(output, 'r') as f:
+            content = f.read()
+
+        bundle = str(tmp_path / 'htmls.bundle')
+        assert HtmlBundle.pack(TEST_HTMLS, bundle) == 5
+        archives = [bundle]
+        for mode, extension in [('w', '.tar'), ('w:gz', '.tar.gz')]:
+            archives.append(str(tmp_path / ('htmls' + extension)))
+            with tarfile.open(archives[-1], mode) as tar:
+                tar.add(TEST_HTMLS)
+        archives.append(str(tmp_path / 'htmls.zip'))
+        with zipfile.ZipFile(archives[-1], 'w', zipfile.ZIP_DEFLATED) as f:
+            for f_html in parser.find_recipe_htmls(TEST_HTMLS):
+                f.write(f_html)
+
+        # Every archive should parse into the same rows as the folder
+        for archive in archives:
+            archive_output = archive + '.csv'
+            manifest = ParseManifest(archive_output + '.manifest.json')
+            assert parser.parse_to_csv(archive, archive_output, manifest) == (5, 2, 0)
+            with open(archive_output, 'r') as f:
+                assert f.read() == content
+            assert parser.parse_to_csv(archive, archive_output, manifest) == (0, 0, 5)
+
+        # A compressed archive is decompressed once, even to hash its htmls
+        archive_output = archives[2] + '.hash.csv'
+        manifest = ParseManifest(archive_output + '.manifest.json', use_hash=True)
+        with patch.object(tarfile, 'open', side_effect=tarfile.open) as open_tar:
+            assert parser.parse_to_csv(archives[2], archive_output, manifest) == (5, 2, 0)
+        assert open_tar.call_count == 1
+        with open(archive_output, 'r') as f:
+            assert f.read() == content
+
+        # A bundle keeps the signatures of the files, so the htmls parsed from
+        # the folder are current, except broken.html which is recorded by path
+        with open_htmls(bundle) as source:
+            with open(TEST_HTML, 'r') as f:
+                assert source.read('13938.html') == f.read()
+        manifest = ParseManifest(output + '.manifest.json').load()
+        assert parser.parse_to_csv(bundle, output, manifest) == (1, 0, 4)
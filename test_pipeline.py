@@ -0,0 +1,29 @@
+import io
+import pipeline
+from build_database import DatabaseBuilder
+from parse_manifest import ParseManifest
+
+TEST_HTMLS = 'parser_test_files'
+
+
+class TestClass:
+
+    def test_pipeline(self, tmp_path):
+        output = str(tmp_path / 'htmls.csv')
+        pipeline.recipe_parser.parse_to_csv(TEST_HTMLS, output, ParseManifest(output + '.manifest.json'))
+        with open(output, 'r') as f_input:
+            f_output = io.StringIO()
+            DatabaseBuilder(f_input, f_output, 'nutriscore.model').build()
+            expected = f_output.getvalue()
+
+        for workers in [1, 2]:
+            f_csv = io.StringIO()
+            f_output = io.StringIO()
+            builder = DatabaseBuilder(None, f_output, 'nutriscore.model', workers=workers)
+            pipeline.run(TEST_HTMLS, builder, jobs=2, f_csv=f_csv, queue_size=1)
+
+            # Streaming the recipes should build the same database as going
+            # through the csv file, which the tap should reproduce
+            assert f_output.getvalue() == expected
+            with open(output, 'r', newline='') as f:
+                assert f_csv.getvalue() == f.read()